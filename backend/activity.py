@@ -0,0 +1,229 @@
+"""
+Compact per-user activity calendar.
+
+Each (user, year) has one `activity_days` document holding the active days of that
+year as a 366-bit set, packed into six 64-bit words w0..w5 (bit n = day-of-year n + 1).
+Days are set atomically with `$bit`, and streaks come from bit operations on the
+concatenated years.
+
+The streaks stored on the user (`current_streak`, `longest_streak`) are the
+authoritative ones: the reward update maintains them atomically, and badges and
+the streak leaderboard read them. That update only runs on activity, so readers
+take the stored current streak through `stored_streak`, which ends it once a whole
+day has passed without activity. The bitmap is the record of which days were
+active. The calendar endpoint reads its streaks from the bitmap, and
+`--repair-streaks` rebuilds the stored fields from it. Both agree with the
+stored fields as long as every streak-counting reward also marks its day.
+
+Maintenance commands:
+
+    python activity.py --backfill        # set bits for every day a quest was completed
+    python activity.py --repair-streaks  # recompute current/longest streaks for all users
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson.int64 import Int64
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+WORD_BITS = 64
+WORDS_PER_YEAR = 6  # 6 * 64 >= 366
+_UINT64 = (1 << 64) - 1
+
+
+def _to_int64(word: int) -> Int64:
+    # Mongo stores signed 64-bit integers
+    return Int64(word - (1 << 64) if word >= (1 << 63) else word)
+
+
+def day_position(day: date) -> Tuple[str, int]:
+    index = day.timetuple().tm_yday - 1
+    return f"w{index // WORD_BITS}", 1 << (index % WORD_BITS)
+
+
+def stored_streak(current_streak: int, last_activity: Optional[datetime], today: Optional[date] = None) -> int:
+    """A user's stored current streak as of ``today``: 0 unless the last active day is today or yesterday."""
+    if last_activity is None:
+        return 0
+    today = today or datetime.now(timezone.utc).date()
+    # Naive datetimes from storage are already UTC
+    if last_activity.tzinfo:
+        last_activity = last_activity.astimezone(timezone.utc)
+    return current_streak if (today - last_activity.date()).days <= 1 else 0
+
+
+def year_bits(doc: dict) -> int:
+    """Unpack an activity_days document into one int, bit n = day-of-year n + 1."""
+    bits = 0
+    for word in range(WORDS_PER_YEAR):
+        bits |= (int(doc.get(f"w{word}", 0)) & _UINT64) << (word * WORD_BITS)
+    return bits
+
+
+async def mark_active(db, user_id: str, day: Optional[date] = None) -> None:
+    day = day or datetime.now(timezone.utc).date()
+    field, mask = day_position(day)
+    await db.activity_days.update_one(
+        {"user_id": user_id, "year": day.year},
+        {"$bit": {field: {"or": _to_int64(mask)}}},
+        upsert=True
+    )
+
+
+async def load_bitmaps(db, user_id: str, years: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    query = {"user_id": user_id}
+    if years is not None:
+        query["year"] = {"$in": list(years)}
+    return {doc["year"]: year_bits(doc) async for doc in db.activity_days.find(query, {"_id": 0, "user_id": 0})}
+
+
+def combine(bitmaps: Dict[int, int]) -> Tuple[date, int]:
+    """Concatenate per-year bitmaps into one int starting at Jan 1 of the earliest year."""
+    if not bitmaps:
+        return date(datetime.now(timezone.utc).year, 1, 1), 0
+    origin = date(min(bitmaps), 1, 1)
+    combined = 0
+    for year, bits in bitmaps.items():
+        combined |= bits << (date(year, 1, 1) - origin).days
+    return origin, combined
+
+
+def active_days(bitmaps: Dict[int, int]) -> List[date]:
+    origin, bits = combine(bitmaps)
+    days = []
+    while bits:
+        low = bits & -bits
+        days.append(origin + timedelta(days=low.bit_length() - 1))
+        bits ^= low
+    return days
+
+
+def longest_run(bits: int) -> int:
+    # Each step shortens every run of ones by one
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def streaks(bitmaps: Dict[int, int], today: Optional[date] = None) -> Tuple[int, int]:
+    """(current streak, longest streak). A streak is still current if its last day is today or yesterday."""
+    today = today or datetime.now(timezone.utc).date()
+    origin, bits = combine(bitmaps)
+    longest = longest_run(bits)
+
+    end = (today - origin).days
+    if end < 0:
+        return 0, longest
+    if not (bits >> end) & 1:
+        end -= 1
+        if end < 0 or not (bits >> end) & 1:
+            return 0, longest
+
+    # Length of the run of ones ending at `end`: distance to the highest zero below it
+    window = bits & ((1 << (end + 1)) - 1)
+    zeros = ~window & ((1 << (end + 1)) - 1)
+    current = end + 1 if zeros == 0 else end - zeros.bit_length() + 1
+    return current, longest
+
+
+async def backfill(db, batch_size: int = 1000) -> int:
+    """Set bits for every (user, day) on which a quest was completed."""
+    pipeline = [
+        {"$match": {"status": "Done", "completed_at": {"$ne": None}}},
+        {"$group": {"_id": {
+            "user_id": "$user_id",
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$completed_at", "timezone": "UTC"}}
+        }}},
+    ]
+    operations = []
+    written = 0
+    async for group in db.quests.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+        day = date.fromisoformat(group["_id"]["day"])
+        field, mask = day_position(day)
+        operations.append(UpdateOne(
+            {"user_id": group["_id"]["user_id"], "year": day.year},
+            {"$bit": {field: {"or": _to_int64(mask)}}},
+            upsert=True
+        ))
+        if len(operations) >= batch_size:
+            await db.activity_days.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+    if operations:
+        await db.activity_days.bulk_write(operations, ordered=False)
+        written += len(operations)
+    return written
+
+
+async def repair_streaks(db, batch_size: int = 1000) -> int:
+    """Recompute every user's streaks from their bitmaps in one pass over activity_days."""
+    today = datetime.now(timezone.utc).date()
+    operations = []
+    repaired = 0
+
+    async def flush():
+        nonlocal operations, repaired
+        if operations:
+            result = await db.users.bulk_write(operations, ordered=False)
+            repaired += result.modified_count
+            operations = []
+
+    def queue(user_id: str, bitmaps: Dict[int, int]):
+        current, longest = streaks(bitmaps, today)
+        fields = {"current_streak": current}
+        origin, bits = combine(bitmaps)
+        if bits:
+            last_day = origin + timedelta(days=bits.bit_length() - 1)
+            fields["last_activity_date"] = datetime.combine(last_day, datetime.min.time()).replace(tzinfo=timezone.utc)
+        # Activity from before the bitmap existed may have produced a longer streak
+        operations.append(UpdateOne({"id": user_id}, {"$set": fields, "$max": {"longest_streak": longest}}))
+
+    user_id, bitmaps = None, {}
+    cursor = db.activity_days.find({}, {"_id": 0}).sort([("user_id", 1), ("year", 1)]).batch_size(batch_size)
+    async for doc in cursor:
+        if doc["user_id"] != user_id:
+            if user_id is not None:
+                queue(user_id, bitmaps)
+            user_id, bitmaps = doc["user_id"], {}
+        bitmaps[doc["year"]] = year_bits(doc)
+        if len(operations) >= batch_size:
+            await flush()
+    if user_id is not None:
+        queue(user_id, bitmaps)
+    await flush()
+    return repaired
+
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if args.backfill:
+            logger.info("Backfilled %d activity days", await backfill(db, args.batch_size))
+        if args.repair_streaks:
+            logger.info("Repaired streaks of %d users", await repair_streaks(db, args.batch_size))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Activity calendar maintenance")
+    parser.add_argument("--backfill", action="store_true", help="set bits from completed quests")
+    parser.add_argument("--repair-streaks", action="store_true", help="recompute streaks for all users")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,47 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+# Upserted by id into the `badges` collection once per seeding.SEED_VERSION, overwriting the seeded fields
+DEFAULT_BADGES = [
+    {"id": "first-steps", "name": "First Steps", "description": "Earn your first 10 XP", "criteria_type": "xp", "criteria_value": 10, "icon": "🌟"},
+    {"id": "rising-star", "name": "Rising Star", "description": "Earn 100 XP", "criteria_type": "xp", "criteria_value": 100, "icon": "⭐"},
+    {"id": "experience-master", "name": "Experience Master", "description": "Earn 1000 XP", "criteria_type": "xp", "criteria_value": 1000, "icon": "🏆"},
+    {"id": "streak-starter", "name": "Streak Starter", "description": "Stay active 3 days in a row", "criteria_type": "streak", "criteria_value": 3, "icon": "🔥"},
+    {"id": "consistency-king", "name": "Consistency King", "description": "Stay active 7 days in a row", "criteria_type": "streak", "criteria_value": 7, "icon": "👑"},
+    {"id": "dedication-legend", "name": "Dedication Legend", "description": "Stay active 30 days in a row", "criteria_type": "streak", "criteria_value": 30, "icon": "🗿"},
+    {"id": "quest-rookie", "name": "Quest Rookie", "description": "Complete 10 quests", "criteria_type": "quests_completed", "criteria_value": 10, "icon": "🗡️"},
+    {"id": "quest-champion", "name": "Quest Champion", "description": "Complete 100 quests", "criteria_type": "quests_completed", "criteria_value": 100, "icon": "🛡️"},
+]
+
+# User document field each criteria type is measured against
+CRITERIA_FIELDS = {
+    "xp": "total_xp",
+    "streak": "longest_streak",
+    "quests_completed": "quests_completed",
+}
+
+
+class BadgeEngine:
+    """Badge definitions grouped by criteria type, in threshold order.
+
+    Badges are awarded inside the atomic reward update (see
+    repositories.build_reward_pipeline): every badge whose threshold the updated
+    user meets and which the user does not hold yet. Evaluating the values the
+    update wrote, rather than values read before it, means concurrent rewards
+    can neither miss a threshold nor award a badge twice.
+    """
+
+    def __init__(self, definitions: Iterable[dict] = ()):
+        self.load(definitions)
+
+    def load(self, definitions: Iterable[dict]) -> None:
+        grouped = defaultdict(list)
+        for badge in definitions:
+            if badge["criteria_type"] in CRITERIA_FIELDS:
+                grouped[badge["criteria_type"]].append(dict(badge))
+
+        self.definitions: List[dict] = []
+        for badges in grouped.values():
+            badges.sort(key=lambda badge: badge["criteria_value"])
+            self.definitions.extend(badges)
+        self.by_name: Dict[str, dict] = {badge["name"]: badge for badge in self.definitions}
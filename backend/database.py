@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Mapping
+
+from pymongo import monitoring
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def mongo_client_options(environ: Mapping[str, str]) -> dict:
+    """AsyncIOMotorClient keyword arguments from MONGO_* settings; unset ones keep the driver default.
+
+    zstd and snappy compression need the `zstandard` / `python-snappy` packages,
+    the driver skips compressors that are not installed.
+    """
+    options = {}
+    integer_settings = {
+        "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+        "MONGO_MIN_POOL_SIZE": "minPoolSize",
+        "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+        "MONGO_ZLIB_COMPRESSION_LEVEL": "zlibCompressionLevel",
+    }
+    for env_name, option in integer_settings.items():
+        if environ.get(env_name):
+            options[option] = int(environ[env_name])
+    if environ.get("MONGO_COMPRESSORS"):
+        options["compressors"] = environ["MONGO_COMPRESSORS"]
+    return options
+
+
+def read_preference_from_env(environ: Mapping[str, str]):
+    """Read preference for list/dashboard reads (MONGO_READ_PREFERENCE, MONGO_READ_MAX_STALENESS_SECONDS)."""
+    name = environ.get("MONGO_READ_PREFERENCE", "primary")
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown MONGO_READ_PREFERENCE {name!r}, expected one of {', '.join(READ_PREFERENCES)}")
+    if name == "primary":
+        return Primary()
+    max_staleness = int(environ.get("MONGO_READ_MAX_STALENESS_SECONDS", "-1"))
+    return READ_PREFERENCES[name](max_staleness=max_staleness)
+
+
+class PoolWaitMonitor(monitoring.ConnectionPoolListener):
+    """Measures how long operations wait to check a connection out of the pool.
+
+    Motor runs driver calls on worker threads; the start of a checkout and its end
+    are reported on the same thread, which is how they are paired up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self.connections = 0
+        self.checked_out = 0
+
+    def _elapsed(self, event) -> float:
+        duration = getattr(event, "duration", None)  # reported by newer drivers
+        if duration is not None:
+            return duration
+        started = getattr(self._local, "started", None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "failed_checkouts": self.failed_checkouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "wait_histogram": {
+                    **{f"le_{bound}s": count for bound, count in zip(WAIT_BUCKETS, self.buckets)},
+                    "gt_5.0s": self.buckets[-1],
+                },
+                "open_connections": self.connections,
+                "checked_out": self.checked_out,
+            }
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._elapsed(event)
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS) if wait <= bound), len(WAIT_BUCKETS))
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.buckets[index] += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.failed_checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
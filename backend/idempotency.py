@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# How long an outcome is replayed; also the TTL of the idempotency_keys collection
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+
+# A worker that dies while running a handler holds its key at most this long
+IDEMPOTENCY_LEASE_SECONDS = 30
+CLAIM_POLL_SECONDS = 0.05
+
+
+class IdempotencyStore:
+    """Replays the outcome of requests that carry an Idempotency-Key.
+
+    Outcomes (results and HTTPExceptions) are kept in a bounded in-process TTL cache
+    and, when ``collection`` is given, in Mongo so that a retry landing on another
+    worker is answered too. Identical requests that arrive while the first one is
+    still running wait for it instead of running again: within a worker on a
+    shared future, across workers by claiming the key first. The claim is a
+    pending document inserted on the unique ``_id``; the worker whose insert
+    wins runs the handler and records the outcome on that document, the others
+    poll until it appears. A claim whose owner died is taken over once its
+    lease has run out. Unexpected errors are not stored and release the claim,
+    so a retry after a crash runs the handler again.
+    """
+
+    def __init__(self, collection=None, maxsize: int = 100000, ttl: float = IDEMPOTENCY_TTL_SECONDS,
+                 lease: float = IDEMPOTENCY_LEASE_SECONDS):
+        self.collection = collection
+        self.lease = lease
+        self._outcomes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+        self.replayed = 0
+        self.waited = 0
+
+    @staticmethod
+    def digest(*parts: str) -> str:
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    async def run(self, key: str, handler: Callable[[], Awaitable]):
+        outcome = self._outcomes.get(key)
+        if outcome is not None:
+            self.replayed += 1
+            return self._replay(outcome)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            outcome = await asyncio.shield(inflight)
+            if outcome is not None:
+                return self._replay(outcome)
+            # The first execution failed unexpectedly, run it again
+            return await self.run(key, handler)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        owner = uuid.uuid4().hex
+        outcome = None
+        try:
+            outcome = await self._claim(key, owner)
+            if outcome is not None:
+                self._outcomes.set(key, outcome)
+            else:
+                try:
+                    outcome = {"status": 200, "body": await handler()}
+                except HTTPException as e:
+                    outcome = {"status": e.status_code, "detail": e.detail}
+                except BaseException:
+                    await self._release(key, owner)
+                    raise
+                await self._store_outcome(key, owner, outcome)
+        finally:
+            del self._inflight[key]
+            future.set_result(outcome)
+        return self._replay(outcome)
+
+    def stats(self) -> dict:
+        return {
+            **self._outcomes.stats(),
+            "inflight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "waited": self.waited,
+        }
+
+    async def _claim(self, key: str, owner: str) -> Optional[dict]:
+        """Claim ``key`` for ``owner``; returns the outcome instead if another worker recorded one."""
+        if self.collection is None:
+            return None
+        waiting = False
+        try:
+            while True:
+                now = datetime.now(timezone.utc)
+                lease_until = now + timedelta(seconds=self.lease)
+                try:
+                    await self.collection.insert_one({"_id": key, "owner": owner, "lease_until": lease_until,
+                                                      "created_at": now})
+                    return None
+                except DuplicateKeyError:
+                    pass
+
+                # Take over a claim whose owner did not finish within its lease
+                if await self.collection.find_one_and_update(
+                    {"_id": key, "outcome": {"$exists": False}, "lease_until": {"$lt": now}},
+                    {"$set": {"owner": owner, "lease_until": lease_until}},
+                    projection={"_id": 1},
+                    return_document=ReturnDocument.AFTER
+                ):
+                    return None
+
+                doc = await self.collection.find_one({"_id": key}, {"_id": 0, "outcome": 1})
+                if doc is None:
+                    # Released after a failure in between; claim it again
+                    continue
+                if "outcome" in doc:
+                    if not waiting:
+                        self.replayed += 1
+                    return doc["outcome"]
+                if not waiting:
+                    waiting = True
+                    self.waited += 1
+                await asyncio.sleep(CLAIM_POLL_SECONDS)
+        except PyMongoError as e:
+            # Run without the cross-worker claim rather than fail the request
+            logger.warning("Idempotency claim failed: %s", e)
+            return None
+
+    async def _release(self, key: str, owner: str) -> None:
+        if self.collection is None:
+            return
+        try:
+            await self.collection.delete_one({"_id": key, "owner": owner, "outcome": {"$exists": False}})
+        except PyMongoError as e:
+            logger.warning("Could not release idempotency claim: %s", e)
+
+    async def _store_outcome(self, key: str, owner: str, outcome: dict) -> None:
+        self._outcomes.set(key, outcome)
+        if self.collection is None:
+            return
+        try:
+            result = await self.collection.update_one(
+                {"_id": key, "owner": owner},
+                {"$set": {"outcome": outcome, "created_at": datetime.now(timezone.utc)},
+                 "$unset": {"owner": "", "lease_until": ""}}
+            )
+            if not result.matched_count:
+                logger.warning("Idempotency claim expired before its outcome was recorded")
+        except PyMongoError as e:
+            logger.warning("Could not persist idempotency outcome: %s", e)
+
+    @staticmethod
+    def _replay(outcome: dict):
+        if outcome["status"] == 200:
+            return outcome["body"]
+        raise HTTPException(status_code=outcome["status"], detail=outcome["detail"])
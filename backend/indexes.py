@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from idempotency import IDEMPOTENCY_TTL_SECONDS
+from invalidation import RESUME_TOKEN_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# How often to log progress of a long-running index build
+PROGRESS_INTERVAL_SECONDS = 5
+
+# Declared indexes, one entry per query shape used in server.py.
+# Names are explicit so drift can be detected by name as well as by key.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "quests": [
+        # find_one/update/delete by {id, user_id}
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # keyset-paginated list by user, dashboard "quests today"
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="user_created_id"
+        ),
+        # dashboard "completed today"
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("completed_at", DESCENDING)],
+            name="user_status_completed"
+        ),
+    ],
+    "power_ups": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="user_created_id"
+        ),
+    ],
+    "bad_guys": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="user_created_id"
+        ),
+    ],
+    "power_up_logs": [
+        IndexModel([("user_id", ASCENDING), ("logged_at", DESCENDING)], name="user_logged"),
+    ],
+    "bad_guy_defeats": [
+        IndexModel([("user_id", ASCENDING), ("logged_at", DESCENDING)], name="user_logged"),
+    ],
+    "side_quests": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # seeding upserts by slug; custom side quests have none
+        IndexModel(
+            [("slug", ASCENDING)], name="slug_unique", unique=True,
+            partialFilterExpression={"slug": {"$exists": True}}
+        ),
+    ],
+    "badges": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "activity_days": [
+        IndexModel([("user_id", ASCENDING), ("year", ASCENDING)], name="user_year_unique", unique=True),
+    ],
+    "idempotency_keys": [
+        # stored outcomes expire with the in-process replay window
+        IndexModel([("created_at", ASCENDING)], name="created_ttl", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ],
+    "change_stream_tokens": [
+        # one resume token per worker process; those of stopped workers go away
+        IndexModel([("updated_at", ASCENDING)], name="updated_ttl", expireAfterSeconds=RESUME_TOKEN_TTL_SECONDS),
+    ],
+    "daily_stats": [
+        # one rollup per user and day; history reads a day range per user
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], name="user_day_unique", unique=True),
+    ],
+}
+
+
+def _key_of(spec) -> tuple:
+    return tuple((field, int(direction)) for field, direction in spec.items())
+
+
+async def index_drift(db) -> Dict[str, Dict[str, list]]:
+    """Compare declared indexes with the ones present in the database.
+
+    Returns ``{collection: {"missing": [...], "extra": [...], "changed": [...]}}``
+    for every collection that differs.
+    """
+    drift = {}
+    for collection, models in INDEXES.items():
+        declared = {m.document["name"]: m.document for m in models}
+        actual = {}
+        async for index in db[collection].list_indexes():
+            if index["name"] != "_id_":
+                actual[index["name"]] = index
+
+        missing = [name for name in declared if name not in actual]
+        extra = [name for name in actual if name not in declared]
+        changed = [
+            name for name in declared
+            if name in actual and (
+                _key_of(declared[name]["key"]) != _key_of(actual[name]["key"])
+                or bool(declared[name].get("unique")) != bool(actual[name].get("unique"))
+            )
+        ]
+        if missing or extra or changed:
+            drift[collection] = {"missing": missing, "extra": extra, "changed": changed}
+    return drift
+
+
+async def index_build_progress(client) -> List[dict]:
+    """Report index builds currently running on the server (requires the inprog privilege)."""
+    try:
+        result = await client.admin.command({
+            "currentOp": True,
+            "$or": [
+                {"op": "command", "command.createIndexes": {"$exists": True}},
+                {"op": "none", "msg": {"$regex": "^Index Build"}},
+            ]
+        })
+    except OperationFailure as e:
+        logger.debug("Index build progress unavailable: %s", e)
+        return []
+
+    builds = []
+    for op in result.get("inprog", []):
+        progress = op.get("progress") or {}
+        builds.append({
+            "ns": op.get("ns"),
+            "msg": op.get("msg"),
+            "done": progress.get("done"),
+            "total": progress.get("total"),
+        })
+    return builds
+
+
+async def ensure_indexes(db) -> Dict[str, Dict[str, list]]:
+    """Create every declared index. Safe to run on each startup.
+
+    Existing indexes with the same spec are a no-op on the server. Indexes that
+    exist but are not declared are reported, never dropped.
+    """
+    drift = await index_drift(db)
+    total = len(INDEXES)
+
+    for position, (collection, models) in enumerate(INDEXES.items(), start=1):
+        pending = drift.get(collection, {}).get("missing", [])
+        if not pending:
+            continue
+        logger.info("Building indexes on %s (%d/%d): %s", collection, position, total, ", ".join(pending))
+        build = asyncio.ensure_future(
+            db[collection].create_indexes([m for m in models if m.document["name"] in pending])
+        )
+        while not build.done():
+            await asyncio.wait({build}, timeout=PROGRESS_INTERVAL_SECONDS)
+            if not build.done():
+                for op in await index_build_progress(db.client):
+                    logger.info("Index build on %s: %s/%s (%s)", op["ns"], op["done"], op["total"], op["msg"])
+        try:
+            build.result()
+        except OperationFailure as e:
+            # e.g. duplicate emails already stored; keep serving and surface the problem
+            logger.error("Index build on %s failed: %s", collection, e)
+
+    drift = await index_drift(db)
+    for collection, diff in drift.items():
+        logger.warning(
+            "Index drift on %s: missing=%s extra=%s changed=%s",
+            collection, diff["missing"], diff["extra"], diff["changed"]
+        )
+    if not drift:
+        logger.info("All declared indexes present")
+    return drift
@@ -0,0 +1,238 @@
+"""
+Cross-process cache invalidation driven by a MongoDB change stream.
+
+Every worker tails one database-level change stream filtered to the collections
+that have subscribers, and calls their handlers for each insert, update, replace
+or delete, wherever the write came from. The resume token is saved in
+``change_stream_tokens`` so that a restarted worker resumes where it stopped.
+
+Change streams need a replica set. On a standalone server, without a database
+(SQLite), or while the stream is down, ``available`` is False: caches rely on
+their TTLs, and the reset handlers run every ``refresh_interval`` seconds so that
+state without a TTL (the leaderboards) catches up with other workers' writes.
+Every transition from up to down runs them too, because events may be missed.
+
+Each worker tails its own stream, so ``consumer`` (the key of the saved resume
+token) must be unique per worker process.
+
+To try it locally, start a single-node replica set:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+
+then set MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 for every worker.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Server error codes
+_NOT_A_REPLICA_SET = 40573
+_HISTORY_LOST = 286
+_INVALID_RESUME_TOKEN = 260
+
+_DOCUMENT_EVENTS = ["insert", "update", "replace", "delete"]
+# A watched collection went away as a whole; handlers are reset
+_COLLECTION_EVENTS = ["drop", "rename"]
+
+# Saved resume tokens of consumers that stopped updating them are dropped after this long
+RESUME_TOKEN_TTL_SECONDS = 7 * 24 * 3600
+
+
+class ChangeStreamInvalidator:
+    """Dispatches change events to per-collection handlers in this process.
+
+    ``subscribe(collection, handler, fields)`` registers ``handler(change)``;
+    ``fields`` are the fullDocument fields it needs (the stream projects the rest
+    away). fullDocument is looked up for updates and is None for deletes.
+    ``on_reset(handler)`` registers a sync or async callback run when events may
+    have been missed, and periodically while the stream is unavailable. With
+    ``db`` None there is no stream, only the periodic refresh.
+    """
+
+    def __init__(self, db, tokens=None, consumer: str = "default",
+                 persist_interval: float = 5.0, max_backoff: float = 30.0,
+                 refresh_interval: Optional[float] = 60.0):
+        self.db = db
+        self.tokens = tokens
+        self.consumer = consumer
+        self.persist_interval = persist_interval
+        self.max_backoff = max_backoff
+        self.refresh_interval = refresh_interval
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+        self._fields: Dict[str, set] = defaultdict(set)
+        self._reset_handlers: List[Callable] = []
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._persisted_at = 0.0
+        self._persisted_token = None
+        self.resume_token = None
+        self.available = False
+        self.events = 0
+        self.resets = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def subscribe(self, collection: str, handler: Callable[[dict], None], fields: Iterable[str] = ()) -> None:
+        self._handlers[collection].append(handler)
+        self._fields[collection].update(fields)
+
+    def on_reset(self, handler: Callable) -> None:
+        self._reset_handlers.append(handler)
+
+    async def start(self) -> None:
+        if self._refresh_task is None and self.refresh_interval and self._reset_handlers:
+            self._refresh_task = asyncio.create_task(self._refresh_while_unavailable())
+        if self._task is not None or not self._handlers or self.db is None:
+            return
+        if self.tokens is not None:
+            try:
+                saved = await self.tokens.find_one({"_id": self.consumer})
+            except PyMongoError as e:
+                logger.warning("Could not load change stream resume token: %s", e)
+                saved = None
+            self.resume_token = self._persisted_token = saved["token"] if saved else None
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.available = False
+        await self._persist_token(force=True)
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "collections": sorted(self._handlers),
+            "events": self.events,
+            "resets": self.resets,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
+
+    def _pipeline(self) -> list:
+        projection = {"operationType": 1, "ns": 1, "documentKey": 1}
+        for fields in self._fields.values():
+            projection.update({f"fullDocument.{field}": 1 for field in fields})
+        return [
+            {"$match": {"$or": [
+                {"ns.coll": {"$in": sorted(self._handlers)}, "operationType": {"$in": _DOCUMENT_EVENTS + _COLLECTION_EVENTS}},
+                # Sent after dropDatabase; the stream cannot continue past it
+                {"operationType": "invalidate"},
+            ]}},
+            {"$project": projection},
+        ]
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with self.db.watch(self._pipeline(), full_document="updateLookup",
+                                         resume_after=self.resume_token) as stream:
+                    if not self.available:
+                        logger.info("Change stream open on %s", ", ".join(sorted(self._handlers)))
+                    self.available = True
+                    backoff = 1.0
+                    async for change in stream:
+                        self.resume_token = stream.resume_token
+                        if change["operationType"] == "invalidate":
+                            self.resume_token = None
+                            await self._reset("database dropped")
+                            break
+                        if change["operationType"] in _COLLECTION_EVENTS:
+                            await self._reset(f"{change['ns']['coll']} {change['operationType']}")
+                            continue
+                        self.events += 1
+                        self._dispatch(change)
+                        await self._persist_token()
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self._failed(e)
+                if e.code in (_HISTORY_LOST, _INVALID_RESUME_TOKEN):
+                    # The saved position is gone; start from now
+                    self.resume_token = None
+                    await self._reset("resume token expired")
+                elif e.code == _NOT_A_REPLICA_SET:
+                    backoff = self.max_backoff
+            except PyMongoError as e:
+                self._failed(e)
+
+            if self.available:
+                self.available = False
+                await self._reset("change stream lost")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _failed(self, error: Exception) -> None:
+        # Log the first failure of a series, retries of an unavailable stream only at debug level
+        self.failures += 1
+        log = logger.warning if self.available or self.failures == 1 else logger.debug
+        log("Change stream unavailable, caches fall back to TTL: %s", error)
+
+    def _dispatch(self, change: dict) -> None:
+        for handler in self._handlers.get(change["ns"]["coll"], ()):
+            try:
+                handler(change)
+            except Exception:
+                logger.exception("Invalidation handler failed for %s", change["ns"]["coll"])
+
+    async def _refresh_while_unavailable(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            if not self.available:
+                self.refreshes += 1
+                await self._run_reset_handlers()
+
+    async def _reset(self, reason: str) -> None:
+        self.resets += 1
+        logger.info("Resetting invalidated caches: %s", reason)
+        await self._run_reset_handlers()
+
+    async def _run_reset_handlers(self) -> None:
+        for handler in self._reset_handlers:
+            try:
+                result = handler()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Cache reset handler failed")
+
+    async def _persist_token(self, force: bool = False) -> None:
+        if self.tokens is None or self.resume_token is None or self.resume_token == self._persisted_token:
+            return
+        if not force and time.monotonic() - self._persisted_at < self.persist_interval:
+            return
+        self._persisted_at = time.monotonic()
+        try:
+            await self.tokens.update_one(
+                {"_id": self.consumer},
+                {"$set": {"token": self.resume_token, "updated_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            self._persisted_token = self.resume_token
+        except PyMongoError as e:
+            logger.warning("Could not save change stream resume token: %s", e)
@@ -0,0 +1,66 @@
+from typing import Dict, List, Optional
+
+from sortedcontainers import SortedList
+
+
+class Leaderboard:
+    """In-memory ranking of users by a score, highest first.
+
+    Backed by a SortedList of ``(-score, user_id)`` keys, so updates, top-N
+    slices and rank lookups are all O(log n). Ties are ordered by user id.
+    """
+
+    def __init__(self):
+        self._ranked = SortedList()
+        self._scores: Dict[str, int] = {}
+        self._usernames: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def set(self, user_id: str, score: int, username: Optional[str] = None) -> None:
+        old_score = self._scores.get(user_id)
+        if old_score is not None:
+            if old_score == score:
+                if username:
+                    self._usernames[user_id] = username
+                return
+            self._ranked.remove((-old_score, user_id))
+        self._ranked.add((-score, user_id))
+        self._scores[user_id] = score
+        if username:
+            self._usernames[user_id] = username
+
+    def remove(self, user_id: str) -> None:
+        score = self._scores.pop(user_id, None)
+        if score is not None:
+            self._ranked.remove((-score, user_id))
+        self._usernames.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._ranked.clear()
+        self._scores.clear()
+        self._usernames.clear()
+
+    def score(self, user_id: str) -> Optional[int]:
+        return self._scores.get(user_id)
+
+    def rank(self, user_id: str) -> Optional[int]:
+        # 1-based position; users with equal scores get consecutive ranks
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self._ranked.index((-score, user_id)) + 1
+
+    def top(self, limit: int, offset: int = 0) -> List[dict]:
+        return [
+            {
+                "rank": position,
+                "user_id": user_id,
+                "username": self._usernames.get(user_id, ""),
+                "score": -negative_score,
+            }
+            for position, (negative_score, user_id) in enumerate(
+                self._ranked.islice(offset, offset + limit), start=offset + 1
+            )
+        ]
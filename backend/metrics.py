@@ -0,0 +1,123 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY,
+)
+from pymongo import monitoring
+from starlette.responses import Response
+
+# With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all of them
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served",
+    ["method"], multiprocess_mode="livesum"
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency",
+    ["collection", "command", "outcome"], buckets=MONGO_BUCKETS
+)
+
+PUSH_CONNECTIONS = Gauge(
+    "push_connections", "Open server-sent event streams",
+    multiprocess_mode="livesum"
+)
+
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds", "Seconds spent in each startup phase; total is import-to-ready",
+    ["phase"]
+)
+
+# Business counters
+XP_AWARDED = Counter("xp_awarded_total", "XP awarded to users", ["source"])
+QUESTS_COMPLETED = Counter("quests_completed_total", "Quests marked as done")
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware; labels requests by route template, not by raw path.
+
+    Requests to ``streaming_paths`` stay open for as long as the client listens, so
+    they are left out of the latency histogram and the in-flight gauge.
+    """
+
+    def __init__(self, app, streaming_paths=()):
+        self.app = app
+        self.streaming_paths = frozenset(streaming_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.streaming_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(method, getattr(route, "path", "unmatched"), str(status)).observe(
+                time.perf_counter() - started
+            )
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records every driver command's latency by collection and command name."""
+
+    def __init__(self):
+        self._collections = {}
+
+    @staticmethod
+    def _collection_of(event) -> str:
+        command = event.command
+        if event.command_name == "getMore":
+            return str(command.get("collection", ""))
+        value = command.get(event.command_name)
+        return value if isinstance(value, str) else ""
+
+    def started(self, event):
+        self._collections[(event.connection_id, event.request_id)] = self._collection_of(event)
+
+    def succeeded(self, event):
+        self._observe(event, "success")
+
+    def failed(self, event):
+        self._observe(event, "failure")
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+
+def metrics_response() -> Response:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,177 @@
+"""
+Server push of per-user state changes over Server-Sent Events.
+
+The reward paths publish the new values of what they changed (XP, level, streaks,
+badges, a bad guy's HP) under a topic: "user" or "bad_guy:<id>". Each open stream
+keeps, per topic, the latest values not yet sent and the values it sent last, and
+writes only the fields that differ:
+
+    event: user
+    data: {"total_xp": 130, "level": 1}
+
+    event: bad_guy
+    data: {"id": "...", "current_hp": 70}
+
+Publishing the same values twice (locally and again from the change stream)
+therefore sends nothing the second time, and a slow client receives one merged
+update instead of a backlog. An idle stream costs one asyncio.Event and two small
+dicts; there is no task or timer per connection. A single heartbeat task wakes
+every stream to send a comment line so proxies keep idle connections open.
+
+Streams end after ``max_stream_seconds`` (with jitter) and EventSource clients
+reconnect on their own. That spreads long-lived connections over workers again
+after a deploy and bounds how long uvicorn's graceful shutdown waits for open
+streams; run uvicorn with --timeout-graceful-shutdown to bound it further.
+"""
+
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Optional, Set
+
+import orjson
+
+HEARTBEAT = b": ping\n\n"
+
+# Sent first; browsers wait this long (ms) before reconnecting an EventSource
+RETRY_MS = 3000
+
+_MISSING = object()
+
+
+class Subscriber:
+    __slots__ = ("user_id", "expires_at", "pending", "sent", "wake", "heartbeat", "closed")
+
+    def __init__(self, user_id: str, expires_at: float):
+        self.user_id = user_id
+        self.expires_at = expires_at
+        self.pending: Dict[str, dict] = {}
+        self.sent: Dict[str, dict] = {}
+        self.wake = asyncio.Event()
+        self.heartbeat = False
+        self.closed = False
+
+    def push(self, topic: str, fields: dict) -> None:
+        self.pending.setdefault(topic, {}).update(fields)
+        self.wake.set()
+
+    def drain(self) -> list:
+        """SSE messages for every pending field that differs from what was sent."""
+        messages = []
+        for topic, fields in self.pending.items():
+            sent = self.sent.setdefault(topic, {})
+            delta = {name: value for name, value in fields.items() if sent.get(name, _MISSING) != value}
+            if not delta:
+                continue
+            sent.update(delta)
+            event, _, key = topic.partition(":")
+            if key:
+                delta = {"id": key, **delta}
+            messages.append(b"event: " + event.encode() + b"\ndata: " + orjson.dumps(delta) + b"\n\n")
+        self.pending.clear()
+        return messages
+
+
+class PushHub:
+    """Open streams of this worker, by user id."""
+
+    def __init__(self, heartbeat_interval: float = 15.0, max_per_user: int = 10,
+                 max_stream_seconds: float = 300.0):
+        self.heartbeat_interval = heartbeat_interval
+        self.max_per_user = max_per_user
+        self.max_stream_seconds = max_stream_seconds
+        self._subscribers: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._task: Optional[asyncio.Task] = None
+        self.connections = 0
+        self.messages = 0
+        self.rejected = 0
+
+    def subscribe(self, user_id: str) -> Optional[Subscriber]:
+        """A new stream for ``user_id``, or None when the user has ``max_per_user`` open already."""
+        streams = self._subscribers[user_id]
+        if len(streams) >= self.max_per_user:
+            self.rejected += 1
+            return None
+        # Jitter keeps streams opened together from all reconnecting together
+        lifetime = self.max_stream_seconds * random.uniform(0.9, 1.0)
+        subscriber = Subscriber(user_id, time.monotonic() + lifetime)
+        streams.add(subscriber)
+        self.connections += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        streams = self._subscribers.get(subscriber.user_id)
+        if streams is None or subscriber not in streams:
+            return
+        streams.discard(subscriber)
+        if not streams:
+            del self._subscribers[subscriber.user_id]
+        self.connections -= 1
+
+    def publish(self, user_id: str, topic: str, fields: dict) -> None:
+        # A dict lookup when the user has no open stream, which is the common case
+        for subscriber in self._subscribers.get(user_id, ()):
+            subscriber.push(topic, fields)
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        """The SSE body for ``subscriber``; unsubscribes when the client goes away."""
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            while True:
+                await subscriber.wake.wait()
+                subscriber.wake.clear()
+                if subscriber.closed:
+                    return
+                messages = subscriber.drain()
+                if messages:
+                    self.messages += len(messages)
+                    yield b"".join(messages)
+                elif subscriber.heartbeat:
+                    yield HEARTBEAT
+                subscriber.heartbeat = False
+        finally:
+            self.unsubscribe(subscriber)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._heartbeats())
+
+    async def stop(self) -> None:
+        # End the streams that are still open
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for streams in list(self._subscribers.values()):
+            for subscriber in streams:
+                subscriber.closed = True
+                subscriber.wake.set()
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "users": len(self._subscribers),
+            "messages": self.messages,
+            "rejected": self.rejected,
+        }
+
+    def ping(self) -> None:
+        """Wake every stream to send a heartbeat; streams past their lifetime end instead."""
+        now = time.monotonic()
+        for streams in list(self._subscribers.values()):
+            for subscriber in list(streams):
+                if subscriber.expires_at <= now:
+                    subscriber.closed = True
+                    # A client that went away before its body started never runs the stream's finally
+                    self.unsubscribe(subscriber)
+                subscriber.heartbeat = True
+                subscriber.wake.set()
+
+    async def _heartbeats(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            self.ping()
@@ -0,0 +1,449 @@
+"""
+Storage backends behind the API.
+
+server.py talks to a storage object rather than to a database handle. Every storage
+has one repository per kind of data: users, quests, power_ups, bad_guys,
+side_quests, badges, logs (power_up_logs and bad_guy_defeats), daily_stats
+(rollups) and activity_days.
+
+MotorStorage (this module) keeps everything in MongoDB. SQLiteStorage
+(sqlite_repositories.py) keeps it in one embedded SQLite file, for single-node
+installs and local runs. STORAGE_BACKEND selects one: "mongo" (the default) or
+"sqlite", with the file at SQLITE_PATH.
+
+Documents go in and come out as plain dicts shaped like the API models. Datetimes
+come back naive in UTC, as Motor returns them. List reads are keyset-paginated
+over (created_at, id); ``after`` is the (created_at, id) of the last item seen.
+Where callers handle a failure, repositories raise StorageError or DuplicateError
+rather than errors of the backend driver.
+"""
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+import activity
+import rollups
+from badges import CRITERIA_FIELDS
+from database import mongo_client_options, read_preference_from_env
+from indexes import ensure_indexes
+from seeding import seed_once, side_quest_operations, upsert_operations
+
+STORAGE_BACKENDS = ("mongo", "sqlite")
+
+
+class StorageError(Exception):
+    """A storage operation failed, e.g. the database was unreachable or timed out."""
+
+
+class DuplicateError(StorageError):
+    """An insert collided with a unique key, e.g. an email that is already registered."""
+
+
+USER_PUBLIC_PROJECTION = {"_id": 0, "password_hash": 0}
+
+DONE = "Done"
+
+# Users updated per bulk write by the quests_completed backfill
+BACKFILL_BATCH_SIZE = 1000
+
+
+def create_storage(environ: Mapping[str, str], default_sqlite_path: Path,
+                   pool_monitor=None, event_listeners: Iterable = ()):
+    backend = environ.get("STORAGE_BACKEND", "mongo")
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected one of {', '.join(STORAGE_BACKENDS)}")
+    if backend == "sqlite":
+        from sqlite_repositories import SQLiteStorage
+        return SQLiteStorage(environ.get("SQLITE_PATH", str(default_sqlite_path)))
+
+    # Pool, compression and timeouts come from MONGO_* settings
+    options = mongo_client_options(environ)
+    listeners = ([pool_monitor] if pool_monitor is not None else []) + list(event_listeners)
+    client = AsyncIOMotorClient(environ["MONGO_URL"], event_listeners=listeners, **options)
+    db = client[environ["DB_NAME"]]
+    # List and dashboard reads may go to secondaries (MONGO_READ_PREFERENCE); writes always use db
+    read_db = client.get_database(environ["DB_NAME"], read_preference=read_preference_from_env(environ))
+    return MotorStorage(client, db, read_db, options, pool_monitor)
+
+
+def _fields_projection(fields: Iterable[str]) -> dict:
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+
+def build_reward_pipeline(xp_gained: int, touch_streak: bool, quests_completed: int,
+                          badge_definitions: Iterable[dict], now: Optional[datetime] = None) -> list:
+    # XP, level, quest count, streak and badges of a reward as one update pipeline
+    now = now or datetime.now(timezone.utc)
+    today_start = datetime.combine(now.date(), datetime.min.time()).replace(tzinfo=timezone.utc)
+    yesterday_start = today_start - timedelta(days=1)
+
+    pipeline = [
+        {"$set": {"total_xp": {"$add": [{"$ifNull": ["$total_xp", 0]}, xp_gained]}}},
+        {"$set": {"level": {"$max": [1, {"$toInt": {"$floor": {"$divide": ["$total_xp", 100]}}}]}}},
+    ]
+
+    if quests_completed:
+        pipeline.append({"$set": {"quests_completed": {"$add": [{"$ifNull": ["$quests_completed", 0]}, quests_completed]}}})
+
+    if touch_streak:
+        # Missing/null last_activity_date sorts below any date, so it falls through to a fresh streak
+        pipeline.append({"$set": {
+            "current_streak": {"$switch": {
+                "branches": [
+                    {"case": {"$gte": ["$last_activity_date", today_start]}, "then": "$current_streak"},
+                    {"case": {"$gte": ["$last_activity_date", yesterday_start]}, "then": {"$add": [{"$ifNull": ["$current_streak", 0]}, 1]}},
+                ],
+                "default": 1
+            }},
+            "last_activity_date": {"$cond": [
+                {"$gte": ["$last_activity_date", today_start]}, "$last_activity_date", now
+            ]}
+        }})
+        pipeline.append({"$set": {
+            "longest_streak": {"$max": [{"$ifNull": ["$longest_streak", 0]}, "$current_streak"]}
+        }})
+
+    # Append every badge whose threshold is met and which the user does not hold yet
+    earned = []
+    for badge in badge_definitions:
+        field = "$" + CRITERIA_FIELDS[badge["criteria_type"]]
+        earned.append({"$cond": [
+            {"$and": [
+                {"$gte": [{"$ifNull": [field, 0]}, badge["criteria_value"]]},
+                {"$not": [{"$in": [badge["name"], "$badges"]}]}
+            ]},
+            badge["name"],
+            None
+        ]})
+
+    pipeline.append({"$set": {"badges": {"$ifNull": ["$badges", []]}}})
+    pipeline.append({"$set": {"badges": {"$concatArrays": [
+        "$badges",
+        {"$filter": {"input": earned, "cond": {"$ne": ["$$this", None]}}}
+    ]}}})
+
+    return pipeline
+
+
+class MotorUserRepository:
+    def __init__(self, collection, quests, locks):
+        self.collection = collection
+        self.quests = quests
+        self.locks = locks
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        # Everything but the password hash
+        return await self.collection.find_one({"id": user_id}, USER_PUBLIC_PROJECTION)
+
+    async def get_fields(self, user_id: str, fields: Iterable[str]) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id}, _fields_projection(fields))
+
+    async def get_by_email(self, email: str, fields: Iterable[str]) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, _fields_projection(fields))
+
+    async def insert(self, doc: dict) -> None:
+        # Raises DuplicateError when the email is already registered
+        try:
+            await self.collection.insert_one(doc)
+        except DuplicateKeyError as e:
+            raise DuplicateError(str(e)) from e
+
+    async def set_fields(self, user_id: str, fields: dict, expected: Optional[dict] = None) -> bool:
+        # With ``expected``, only updates while those fields still hold the given values
+        result = await self.collection.update_one({"id": user_id, **(expected or {})}, {"$set": fields})
+        return result.matched_count > 0
+
+    async def apply_rewards(self, user_id: str, xp_gained: int, touch_streak: bool,
+                            quests_completed: int, badge_definitions: Iterable[dict]) -> Optional[dict]:
+        # Single atomic round trip; returns the user's post-image without the password hash
+        return await self.collection.find_one_and_update(
+            {"id": user_id},
+            build_reward_pipeline(xp_gained, touch_streak, quests_completed, badge_definitions),
+            projection=USER_PUBLIC_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def scan(self, fields: Iterable[str]) -> AsyncIterator[dict]:
+        async for user_data in self.collection.find({}, _fields_projection(fields)):
+            yield user_data
+
+    async def backfill_quests_completed(self, badge_definitions: Iterable[dict]) -> None:
+        # Once across workers: count the quests completed before users.quests_completed existed.
+        # $max keeps the increments made since; the reward pipeline with nothing to add
+        # then awards the quest badges the new count has earned.
+        definitions = list(badge_definitions)
+
+        async def backfill():
+            operations = []
+            async for row in self.quests.aggregate([
+                {"$match": {"status": DONE}},
+                {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+            ]):
+                operations.append(UpdateOne({"id": row["_id"]}, [
+                    {"$set": {"quests_completed": {"$max": [{"$ifNull": ["$quests_completed", 0]}, row["count"]]}}},
+                    *build_reward_pipeline(0, False, 0, definitions)
+                ]))
+                if len(operations) >= BACKFILL_BATCH_SIZE:
+                    await self.collection.bulk_write(operations, ordered=False)
+                    operations = []
+            if operations:
+                await self.collection.bulk_write(operations, ordered=False)
+
+        await seed_once(self.locks, "users.quests_completed", backfill, version=1)
+
+
+class MotorItemRepository:
+    """Items owned by a user (power-ups; base of quests and bad guys)."""
+
+    def __init__(self, collection, read_collection):
+        self.collection = collection
+        self.read_collection = read_collection
+
+    def _cursor(self, user_id: str, fields: Iterable[str], filters: Optional[dict], after: Optional[tuple]):
+        query = {"user_id": user_id, **(filters or {})}
+        if after:
+            created_at, item_id = after
+            query["$or"] = [
+                {"created_at": {"$gt": created_at}},
+                {"created_at": created_at, "id": {"$gt": item_id}}
+            ]
+        return self.read_collection.find(query, _fields_projection(fields)).sort([("created_at", 1), ("id", 1)])
+
+    async def page(self, user_id: str, fields: Iterable[str], filters: Optional[dict] = None,
+                   after: Optional[tuple] = None, limit: Optional[int] = None) -> List[dict]:
+        cursor = self._cursor(user_id, fields, filters, after)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(None)
+
+    async def iterate(self, user_id: str, fields: Iterable[str], filters: Optional[dict] = None,
+                      after: Optional[tuple] = None, limit: Optional[int] = None) -> AsyncIterator[dict]:
+        cursor = self._cursor(user_id, fields, filters, after)
+        if limit:
+            cursor = cursor.limit(limit)
+        async for doc in cursor:
+            yield doc
+
+    async def get(self, user_id: str, item_id: str, fields: Iterable[str]) -> Optional[dict]:
+        return await self.collection.find_one({"id": item_id, "user_id": user_id}, _fields_projection(fields))
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one(doc)
+
+    async def insert_many(self, docs: List[dict]) -> Dict[int, str]:
+        """Insert what can be inserted; returns {position: error message} for the rest."""
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+        return {}
+
+    async def delete(self, user_id: str, item_id: str) -> bool:
+        result = await self.collection.delete_one({"id": item_id, "user_id": user_id})
+        return result.deleted_count > 0
+
+
+class MotorQuestRepository(MotorItemRepository):
+    async def complete(self, user_id: str, quest_id: str, completed_at: datetime) -> Optional[int]:
+        # Only a quest that is not done yet can be claimed, so concurrent completions award XP once
+        quest_data = await self.collection.find_one_and_update(
+            {"id": quest_id, "user_id": user_id, "status": {"$ne": DONE}},
+            {"$set": {"status": DONE, "completed_at": completed_at}},
+            projection={"_id": 0, "xp_reward": 1}
+        )
+        return quest_data["xp_reward"] if quest_data else None
+
+    async def complete_many(self, user_id: str, quest_ids: List[str], completed_at: datetime) -> Dict[str, dict]:
+        """Complete every listed quest that is not done yet.
+
+        Returns ``{quest_id: {"xp_reward", "claimed"}}`` for the quests found, where
+        ``claimed`` is False for quests that were already done.
+        """
+        # Claim in one write; the batch token tells us which quests this call claimed
+        batch_token = str(uuid.uuid4())
+        await self.collection.update_many(
+            {"id": {"$in": quest_ids}, "user_id": user_id, "status": {"$ne": DONE}},
+            {"$set": {"status": DONE, "completed_at": completed_at, "completion_batch": batch_token}}
+        )
+        return {
+            quest["id"]: {"xp_reward": quest["xp_reward"], "claimed": quest.get("completion_batch") == batch_token}
+            async for quest in self.collection.find(
+                {"id": {"$in": quest_ids}, "user_id": user_id},
+                {"_id": 0, "id": 1, "xp_reward": 1, "completion_batch": 1}
+            )
+        }
+
+    async def count_today(self, user_id: str, since: datetime) -> Tuple[int, int]:
+        """(quests created, quests completed) since ``since``, in one aggregation."""
+        created_today = {"created_at": {"$gte": since}}
+        completed_today = {"status": DONE, "completed_at": {"$gte": since}}
+        counters = await self.read_collection.aggregate([
+            {"$match": {"user_id": user_id, "$or": [created_today, completed_today]}},
+            {"$facet": {
+                "created": [{"$match": created_today}, {"$count": "count"}],
+                "completed": [{"$match": completed_today}, {"$count": "count"}]
+            }}
+        ]).to_list(1)
+        facets = counters[0] if counters else {}
+
+        def facet_count(name: str) -> int:
+            bucket = facets.get(name) or [{}]
+            return bucket[0].get("count", 0)
+
+        return facet_count("created"), facet_count("completed")
+
+
+class MotorBadGuyRepository(MotorItemRepository):
+    async def hit(self, user_id: str, bad_guy_id: str, damage: int) -> Optional[dict]:
+        """Deal damage, detect the kill and respawn in one atomic update so concurrent hits all land.
+
+        Returns ``current_hp``, ``defeat_count``, ``defeat_xp_reward`` and ``defeated``.
+        """
+        # Every expression of a single $set stage sees the pre-image, so both use the HP before this hit
+        kills = {"$lte": [{"$subtract": ["$current_hp", damage]}, 0]}
+        before = await self.collection.find_one_and_update(
+            {"id": bad_guy_id, "user_id": user_id},
+            [
+                {"$set": {
+                    "current_hp": {"$cond": [kills, "$max_hp", {"$subtract": ["$current_hp", damage]}]},
+                    "defeat_count": {"$add": [{"$ifNull": ["$defeat_count", 0]}, {"$cond": [kills, 1, 0]}]}
+                }}
+            ],
+            projection={"_id": 0, "current_hp": 1, "max_hp": 1, "defeat_count": 1, "defeat_xp_reward": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None
+        # The same outcome, worked out from the pre-image
+        current_hp = before["current_hp"] - damage
+        defeated = current_hp <= 0
+        return {
+            "current_hp": before["max_hp"] if defeated else current_hp,
+            "defeat_count": before.get("defeat_count", 0) + (1 if defeated else 0),
+            "defeat_xp_reward": before["defeat_xp_reward"],
+            "defeated": defeated
+        }
+
+
+class MotorSideQuestRepository:
+    def __init__(self, collection, locks):
+        self.collection = collection
+        self.locks = locks
+
+    async def seed(self, defaults: List[dict]) -> None:
+        # One bulk upsert by slug, once per seed version across workers
+        async def seed():
+            await self.collection.bulk_write(side_quest_operations(defaults), ordered=False)
+            # Concurrent workers used to seed the defaults more than once; drop the extra copies
+            await self.collection.delete_many({
+                "slug": {"$exists": False},
+                "title": {"$in": [sq["title"] for sq in defaults]}
+            })
+
+        await seed_once(self.locks, "side_quests", seed)
+
+    async def all(self) -> List[dict]:
+        # Sorted by id so the daily pick is stable across workers and reloads
+        return await self.collection.find({}, {"_id": 0}).sort("id", 1).to_list(None)
+
+
+class MotorBadgeRepository:
+    def __init__(self, collection, locks):
+        self.collection = collection
+        self.locks = locks
+
+    async def seed(self, defaults: List[dict]) -> None:
+        async def seed():
+            await self.collection.bulk_write(upsert_operations(defaults, "id"), ordered=False)
+
+        await seed_once(self.locks, "badges", seed)
+
+    async def all(self) -> List[dict]:
+        return await self.collection.find({}, {"_id": 0}).to_list(None)
+
+
+class MotorLogRepository:
+    """Append-only activity logs (power_up_logs, bad_guy_defeats), written by the write-behind buffer."""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def insert_many(self, kind: str, docs: List[dict]) -> Dict[int, str]:
+        """Insert what can be inserted; returns {position: error message} for the rest.
+
+        Raises StorageError when the batch may succeed on retry.
+        """
+        try:
+            await self.db[kind].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates are documents an earlier attempt already wrote
+            return {
+                error["index"]: error["errmsg"]
+                for error in e.details.get("writeErrors", []) if error.get("code") != 11000
+            }
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+        return {}
+
+
+class MotorDailyStatsRepository:
+    def __init__(self, db):
+        self.db = db
+
+    async def record(self, user_id: str, **counters: int) -> None:
+        await rollups.record_activity(self.db, user_id, **counters)
+
+    async def history(self, user_id: str, start, end) -> List[dict]:
+        return await rollups.history(self.db, user_id, start, end)
+
+
+class MotorActivityRepository:
+    def __init__(self, db):
+        self.db = db
+
+    async def mark_active(self, user_id: str, day=None) -> None:
+        await activity.mark_active(self.db, user_id, day)
+
+    async def load_bitmaps(self, user_id: str, years: Optional[Iterable[int]] = None) -> Dict[int, int]:
+        return await activity.load_bitmaps(self.db, user_id, years)
+
+
+class MotorStorage:
+    backend = "mongo"
+
+    def __init__(self, client, db, read_db, options: Optional[dict] = None, pool_monitor=None):
+        self.client = client
+        self.db = db
+        self.read_db = read_db
+        self.options = options or {}
+        self.pool_monitor = pool_monitor
+        self.users = MotorUserRepository(db.users, db.quests, db.seed_locks)
+        self.quests = MotorQuestRepository(db.quests, read_db.quests)
+        self.power_ups = MotorItemRepository(db.power_ups, read_db.power_ups)
+        self.bad_guys = MotorBadGuyRepository(db.bad_guys, read_db.bad_guys)
+        self.side_quests = MotorSideQuestRepository(db.side_quests, db.seed_locks)
+        self.badges = MotorBadgeRepository(db.badges, db.seed_locks)
+        self.logs = MotorLogRepository(db)
+        self.daily_stats = MotorDailyStatsRepository(db)
+        self.activity_days = MotorActivityRepository(db)
+
+    async def prepare(self) -> None:
+        await ensure_indexes(self.db)
+
+    async def close(self) -> None:
+        self.client.close()
+
+    async def stats(self) -> dict:
+        # Connection pool checkout waits show pool starvation
+        return {
+            "backend": self.backend,
+            "pool": self.pool_monitor.stats() if self.pool_monitor is not None else None,
+            "options": self.options,
+            "read_preference": self.read_db.read_preference.mongos_mode
+        }
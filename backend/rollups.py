@@ -0,0 +1,182 @@
+"""
+Per-user, per-day activity rollups (one `daily_stats` document per user and UTC day).
+
+The reward paths increment the rollups as activity happens; history queries read
+only this collection. Days before rollups existed can be rebuilt from the raw logs
+with the backfill command:
+
+    python rollups.py --until 2024-06-01 [--batch-size 1000]
+
+The backfill only writes days strictly before --until, which is required and
+should be the day live rollups were deployed; logs from before then were written
+synchronously, so they are complete. Each source (quests, power-up logs, bad-guy
+hit logs) sets its own counters and XP field rather than incrementing them, and
+moves xp by the difference to that source's previous XP. Running it again, or
+over days that live rollups already counted, therefore gives the same result.
+Side quests and bad-guy kills are not logged, so side-quest XP and
+bad_guys_defeated are left as they are.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = (
+    "xp",
+    # XP per backfilled source, also counted in xp; kept apart so the backfill can recompute it
+    "quest_xp",
+    "power_up_xp",
+    "bad_guy_xp",
+    "quests_completed",
+    "power_ups_logged",
+    "bad_guy_hits",
+    "bad_guys_defeated",
+    "side_quests_completed",
+)
+
+
+def day_key(moment: datetime) -> str:
+    # Naive datetimes from Mongo are already UTC
+    if moment.tzinfo:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%d")
+
+
+async def record_activity(db, user_id: str, **counters: int) -> None:
+    """Increment today's rollup for ``user_id``, e.g. ``record_activity(db, uid, xp=10, quests_completed=1)``."""
+    increments = {name: value for name, value in counters.items() if value}
+    if not increments:
+        return
+    today = day_key(datetime.now(timezone.utc))
+    await db.daily_stats.update_one(
+        {"user_id": user_id, "day": today},
+        {"$inc": increments},
+        upsert=True
+    )
+
+
+async def history(db, user_id: str, start: date, end: date) -> List[dict]:
+    """Daily counters from ``start`` to ``end`` inclusive, with zeroes for days without activity."""
+    stored = {
+        doc["day"]: doc async for doc in db.daily_stats.find(
+            {"user_id": user_id, "day": {"$gte": start.isoformat(), "$lte": end.isoformat()}},
+            {"_id": 0, "user_id": 0}
+        )
+    }
+    return fill_days(stored, start, end)
+
+
+def fill_days(stored: Dict[str, dict], start: date, end: date) -> List[dict]:
+    """One row per day from ``start`` to ``end``; ``stored`` maps day keys to their counters."""
+    days = []
+    current = start
+    while current <= end:
+        doc = stored.get(current.isoformat(), {})
+        days.append({"day": current.isoformat(), **{name: doc.get(name, 0) for name in COUNTERS}})
+        current += timedelta(days=1)
+    return days
+
+
+def _day_of(field: str) -> dict:
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": field, "timezone": "UTC"}}
+
+
+def _backfill_pipelines(until: date) -> Dict[str, Tuple[str, list]]:
+    # Collection -> (its XP field, pipeline grouping it into that field and its counters per user and day)
+    cutoff = datetime.combine(until, datetime.min.time()).replace(tzinfo=timezone.utc)
+    return {
+        "quests": ("quest_xp", [
+            {"$match": {"status": "Done", "completed_at": {"$lt": cutoff}}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "day": _day_of("$completed_at")},
+                "quests_completed": {"$sum": 1},
+                "quest_xp": {"$sum": "$xp_reward"},
+            }},
+        ]),
+        "power_up_logs": ("power_up_xp", [
+            {"$match": {"logged_at": {"$lt": cutoff}}},
+            {"$lookup": {"from": "power_ups", "localField": "power_up_id", "foreignField": "id", "as": "power_up"}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "day": _day_of("$logged_at")},
+                "power_ups_logged": {"$sum": 1},
+                "power_up_xp": {"$sum": {"$ifNull": [{"$arrayElemAt": ["$power_up.xp_reward", 0]}, 5]}},
+            }},
+        ]),
+        "bad_guy_defeats": ("bad_guy_xp", [
+            {"$match": {"logged_at": {"$lt": cutoff}}},
+            {"$lookup": {"from": "bad_guys", "localField": "bad_guy_id", "foreignField": "id", "as": "bad_guy"}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "day": _day_of("$logged_at")},
+                "bad_guy_hits": {"$sum": 1},
+                "bad_guy_xp": {"$sum": {"$ifNull": [{"$arrayElemAt": ["$bad_guy.defeat_xp_reward", 0]}, 15]}},
+            }},
+        ]),
+    }
+
+
+def _backfill_update(counters: Dict[str, int], xp_field: str) -> list:
+    # Sets the source's counters and moves xp by the change in the source's XP
+    return [{"$set": {
+        "xp": {"$add": [
+            {"$ifNull": ["$xp", 0]},
+            {"$subtract": [counters[xp_field], {"$ifNull": ["$" + xp_field, 0]}]}
+        ]},
+        **counters,
+    }}]
+
+
+async def backfill(db, until: date, batch_size: int = 1000) -> int:
+    """Recompute the logged counters of days before ``until`` from quests and activity logs."""
+    written = 0
+    for collection, (xp_field, pipeline) in _backfill_pipelines(until).items():
+        operations = []
+        cursor = db[collection].aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+        async for group in cursor:
+            key = group.pop("_id")
+            operations.append(UpdateOne(
+                {"user_id": key["user_id"], "day": key["day"]},
+                _backfill_update(group, xp_field),
+                upsert=True
+            ))
+            if len(operations) >= batch_size:
+                await db.daily_stats.bulk_write(operations, ordered=False)
+                written += len(operations)
+                operations = []
+        if operations:
+            await db.daily_stats.bulk_write(operations, ordered=False)
+            written += len(operations)
+        logger.info("Backfilled rollups from %s (%d upserts so far)", collection, written)
+    return written
+
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        written = await backfill(client[os.environ['DB_NAME']], args.until, args.batch_size)
+        logger.info("Backfill finished: %d rollup upserts", written)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Backfill daily activity rollups from quests and activity logs")
+    parser.add_argument("--until", type=date.fromisoformat, required=True,
+                        help="first day NOT to backfill (YYYY-MM-DD): the day live rollups were deployed")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    if args.until > datetime.now(timezone.utc).date():
+        parser.error("--until must not be after today (UTC)")
+    asyncio.run(_main(args))
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, List
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Bump when the defaults below (or badges.DEFAULT_BADGES) change: running deployments then seed
+# again, which overwrites the fields the defaults define on the seeded documents
+SEED_VERSION = 1
+
+# Upserted by slug; the slug must never change once shipped
+DEFAULT_SIDE_QUESTS = [
+    {"slug": "deep-breaths", "title": "Take 10 Deep Breaths", "description": "Practice mindful breathing for stress relief", "xp_reward": 8},
+    {"slug": "gratitude-list", "title": "Write 3 Things You're Grateful For", "description": "Practice gratitude to boost positivity", "xp_reward": 8},
+    {"slug": "push-ups", "title": "Do 20 Push-ups", "description": "Get your blood pumping with quick exercise", "xp_reward": 8},
+    {"slug": "glass-of-water", "title": "Drink a Full Glass of Water", "description": "Stay hydrated for better health", "xp_reward": 5},
+    {"slug": "tidy-workspace", "title": "Tidy Your Workspace", "description": "Create a cleaner environment for productivity", "xp_reward": 8},
+    {"slug": "text-someone", "title": "Text Someone You Care About", "description": "Strengthen your social connections", "xp_reward": 8},
+    {"slug": "five-minute-walk", "title": "Take a 5-Minute Walk", "description": "Get moving and clear your head", "xp_reward": 8},
+    {"slug": "favorite-song", "title": "Listen to Your Favorite Song", "description": "Boost your mood with music", "xp_reward": 5},
+]
+
+# A worker that dies while seeding holds the lock at most this long
+LOCK_LEASE_SECONDS = 60
+LOCK_POLL_SECONDS = 0.1
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _seed_update(doc: dict, insert_only: Iterable[str]) -> dict:
+    # The seed owns every field of the default except those only set when the document is created
+    update = {"$set": {k: v for k, v in doc.items() if k not in insert_only}}
+    created = {k: doc[k] for k in insert_only if k in doc}
+    if created:
+        update["$setOnInsert"] = created
+    return update
+
+
+def upsert_operations(documents: Iterable[dict], key: str) -> List[UpdateOne]:
+    """One upsert per document keyed on ``key``, setting every field of the document."""
+    return [UpdateOne({key: doc[key]}, _seed_update(doc, ()), upsert=True) for doc in documents]
+
+
+def side_quest_operations(documents: Iterable[dict]) -> List[UpdateOne]:
+    # Side quests seeded before slugs existed are matched by title and adopt the slug.
+    # The id is generated per call, so it is only set on insert.
+    return [
+        UpdateOne(
+            {"$or": [{"slug": doc["slug"]}, {"title": doc["title"], "slug": {"$exists": False}}]},
+            _seed_update(doc, ("id",)),
+            upsert=True
+        )
+        for doc in documents
+    ]
+
+
+async def seed_once(locks, name: str, seed: Callable[[], Awaitable], version: int = SEED_VERSION) -> bool:
+    """Run ``seed`` once per ``version`` across all workers sharing the database.
+
+    The lock is a document in ``locks`` (``_id`` = ``name``) holding the seeded
+    version and a lease. The worker that takes the lease seeds; the others wait
+    until the version is recorded, or take over if the lease runs out. Returns
+    whether this worker ran ``seed``.
+    """
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches only if not yet seeded at this version and nobody holds a live lease;
+            # otherwise the upsert collides with the existing _id
+            await locks.find_one_and_update(
+                {
+                    "_id": name,
+                    "version": {"$ne": version},
+                    "$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}],
+                },
+                {"$set": {"owner": _OWNER, "locked_until": now + timedelta(seconds=LOCK_LEASE_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            lock = await locks.find_one({"_id": name}, {"version": 1})
+            if lock and lock.get("version") == version:
+                return False
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            continue
+
+        try:
+            await seed()
+        except BaseException:
+            await locks.update_one({"_id": name, "owner": _OWNER}, {"$set": {"locked_until": None}})
+            raise
+        await locks.update_one(
+            {"_id": name, "owner": _OWNER},
+            {"$set": {"version": version, "locked_until": None, "seeded_at": datetime.now(timezone.utc)}}
+        )
+        logger.info("Seeded %s (version %d)", name, version)
+        return True
@@ -1,29 +1,108 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+import time
+
+# Taken before the heavy imports below; the lifespan handler reports import-to-ready time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Header
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field, ValidationError
+from pydantic_core import PydanticUndefined
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+import socket
+import hashlib
+import base64
+from datetime import date, datetime, timezone, timedelta
 import jwt
+import orjson
 import bcrypt
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from database import PoolWaitMonitor
+from metrics import (MongoCommandMetrics, PrometheusMiddleware, PUSH_CONNECTIONS, QUESTS_COMPLETED, STARTUP_SECONDS,
+                     XP_AWARDED, metrics_response)
+from cache import TTLCache
+from badges import BadgeEngine, DEFAULT_BADGES
+from writebehind import WriteBehindBuffer
+from leaderboard import Leaderboard
+import rollups
+import activity
+from idempotency import IdempotencyStore, IDEMPOTENCY_TTL_SECONDS
+from invalidation import ChangeStreamInvalidator
+from seeding import DEFAULT_SIDE_QUESTS
+from repositories import DuplicateError, create_storage
+from push import PushHub
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Storage backend (STORAGE_BACKEND): MongoDB by default, or an embedded SQLite file (see repositories.py)
+pool_monitor = PoolWaitMonitor()
+storage = create_storage(os.environ, ROOT_DIR / 'superbetter.sqlite3',
+                         pool_monitor=pool_monitor, event_listeners=[MongoCommandMetrics()])
+
+# Mongo database for the Mongo-only features (shared idempotency outcomes, change streams); None with SQLite
+db = storage.db
+
+# Activity logs (power_up_logs, bad_guy_defeats) are written in the background
+activity_log_writer = WriteBehindBuffer(
+    storage.logs,
+    max_size=int(os.environ.get('ACTIVITY_LOG_BUFFER_SIZE', '10000')),
+    batch_size=int(os.environ.get('ACTIVITY_LOG_BATCH_SIZE', '500')),
+    flush_interval=float(os.environ.get('ACTIVITY_LOG_FLUSH_SECONDS', '1.0'))
+)
+
+# Outcomes of reward requests sent with an Idempotency-Key header
+idempotent_requests = IdempotencyStore(
+    db.idempotency_keys if db is not None else None,
+    maxsize=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '100000')),
+    ttl=IDEMPOTENCY_TTL_SECONDS
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    activity_log_writer.start()
+    push_hub.start()
+    
+    # Time until uvicorn starts the app, then each startup phase
+    timings = {"import": time.perf_counter() - IMPORT_STARTED}
+    phases = [
+        ("storage", storage.prepare),
+        ("seed", lambda: asyncio.gather(initialize_side_quests(), initialize_badges())),
+        ("backfill", lambda: storage.users.backfill_quests_completed(badge_engine.definitions)),
+        ("leaderboards", rebuild_leaderboards),
+    ]
+    # Opened before the leaderboards are rebuilt so no change falls in between
+    await change_invalidator.start()
+    for phase, run in phases:
+        started = time.perf_counter()
+        await run()
+        timings[phase] = time.perf_counter() - started
+    timings["total"] = time.perf_counter() - IMPORT_STARTED
+    for phase, seconds in timings.items():
+        STARTUP_SECONDS.labels(phase).set(seconds)
+    logger.info("Ready in %.2fs (%s)", timings["total"],
+                ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items() if phase != "total"))
+    
+    yield
+    
+    # Flush buffered activity logs before the connection goes away
+    await push_hub.stop()
+    await change_invalidator.stop()
+    await activity_log_writer.stop()
+    await storage.close()
+    password_executor.shutdown(wait=False)
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -32,8 +111,68 @@ api_router = APIRouter(prefix="/api")
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24 * 7  # 1 week
+ACCESS_TOKEN_MINUTES = int(os.environ.get('ACCESS_TOKEN_MINUTES', '15'))
+# Push tokens only open the progress stream and are checked when it connects
+PUSH_TOKEN_SECONDS = int(os.environ.get('PUSH_TOKEN_SECONDS', '60'))
+
+# Verified tokens (sha256 of token -> payload), each kept until the token expires
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+verified_tokens = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=JWT_EXPIRATION_HOURS * 3600)
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# List endpoints: largest page a client may request with ?limit=
+MAX_PAGE_SIZE = 500
+
+# Batch endpoints: most items accepted per request
+MAX_BATCH_SIZE = 500
+
+# Progress history: default and largest range in days
+DEFAULT_HISTORY_DAYS = 30
+MAX_HISTORY_DAYS = 366
+
+# Password hashing settings; bcrypt releases the GIL, so a small thread pool keeps it off the event loop
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', '4'))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+
+# Authenticated-user cache (user id -> user document without password hash)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+# Cross-worker invalidation from a change stream (needs a replica set, see invalidation.py).
+# While the stream is live, cached users are kept for USER_CACHE_COHERENT_TTL_SECONDS instead;
+# while it is not (or with SQLite), caches are reset and leaderboards rebuilt every CACHE_REFRESH_SECONDS.
+CACHE_INVALIDATION_STREAM = os.environ.get('CACHE_INVALIDATION_STREAM', '1') == '1'
+USER_CACHE_COHERENT_TTL_SECONDS = float(os.environ.get('USER_CACHE_COHERENT_TTL_SECONDS', '300'))
+CACHE_REFRESH_SECONDS = float(os.environ.get('CACHE_REFRESH_SECONDS', '60'))
+change_invalidator = ChangeStreamInvalidator(
+    db if CACHE_INVALIDATION_STREAM else None,
+    db.change_stream_tokens if db is not None else None,
+    # One resume token per worker process
+    consumer=os.environ.get('CACHE_INVALIDATION_CONSUMER', f"{socket.gethostname()}:{os.getpid()}"),
+    refresh_interval=CACHE_REFRESH_SECONDS
+)
+
+# Leaderboards, rebuilt from the users collection on startup and kept current by the reward paths
+leaderboards = {"xp": Leaderboard(), "streak": Leaderboard()}
+LEADERBOARD_FIELDS = {"xp": "total_xp", "streak": "longest_streak"}
+MAX_LEADERBOARD_SIZE = 100
+
+# Server-sent event streams of each user's progress (see push.py and /api/push)
+push_hub = PushHub(
+    heartbeat_interval=float(os.environ.get('PUSH_HEARTBEAT_SECONDS', '15')),
+    max_per_user=int(os.environ.get('PUSH_MAX_STREAMS_PER_USER', '10')),
+    max_stream_seconds=float(os.environ.get('PUSH_MAX_STREAM_SECONDS', '300'))
+)
+PUSH_USER_FIELDS = ("total_xp", "level", "current_streak", "longest_streak", "badges")
+
+# Side quest catalog cache and per (user, UTC day) daily picks
+SIDE_QUEST_CATALOG_TTL_SECONDS = float(os.environ.get('SIDE_QUEST_CATALOG_TTL_SECONDS', '300'))
+side_quest_catalog = TTLCache(maxsize=1, ttl=SIDE_QUEST_CATALOG_TTL_SECONDS)
+daily_side_quest_picks = TTLCache(maxsize=USER_CACHE_SIZE, ttl=24 * 3600)
 
 # Enums
 class QuestType(str, Enum):
@@ -56,6 +195,7 @@ class User(BaseModel):
     level: int = 1
     current_streak: int = 0
     longest_streak: int = 0
+    quests_completed: int = 0
     last_activity_date: Optional[datetime] = None
     badges: List[str] = []
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -87,6 +227,9 @@ class QuestCreate(BaseModel):
     quest_type: QuestType
     deadline: Optional[datetime] = None
 
+class QuestBatchComplete(BaseModel):
+    quest_ids: List[str] = Field(..., max_length=MAX_BATCH_SIZE)
+
 class PowerUp(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -113,6 +256,7 @@ class BadGuy(BaseModel):
     max_hp: int = 100
     current_hp: int = 100
     defeat_xp_reward: int = 15
+    defeat_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class BadGuyCreate(BaseModel):
@@ -129,6 +273,7 @@ class BadGuyDefeat(BaseModel):
 
 class SideQuest(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    slug: Optional[str] = None  # stable key of the seeded defaults
     title: str
     description: str
     xp_reward: int = 8
@@ -150,11 +295,26 @@ class DashboardStats(BaseModel):
 
 # Utility functions
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def password_needs_rehash(hashed: str) -> bool:
+    # bcrypt hashes look like $2b$<cost>$<salt+hash>
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, verify_password, password, hashed)
+
 def create_jwt_token(user_id: str) -> str:
     payload = {
         "user_id": user_id,
@@ -162,22 +322,78 @@ def create_jwt_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("user_id")
-        if not user_id:
+def create_access_token(user_id: str, username: str, email: str) -> str:
+    # Short-lived token carrying what read-only routes need, see get_token_user
+    payload = {
+        "user_id": user_id,
+        "username": username,
+        "email": email,
+        "typ": "access",
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_MINUTES)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def create_push_token(user_id: str) -> str:
+    # Goes in a URL (EventSource cannot send headers), so it is scoped to /api/push and expires quickly
+    payload = {
+        "user_id": user_id,
+        "typ": "push",
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=PUSH_TOKEN_SECONDS)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def verify_jwt_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = verified_tokens.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        if not payload.get("user_id"):
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user_data = await db.users.find_one({"id": user_id})
+        # The cache entry must not outlive the token
+        if "exp" in payload:
+            remaining = payload["exp"] - time.time()
+            if remaining > 0:
+                verified_tokens.set(key, payload, ttl=remaining)
+        else:
+            verified_tokens.set(key, payload)
+    return payload
+
+def cache_user(user_id: str, user_data: dict):
+    ttl = USER_CACHE_COHERENT_TTL_SECONDS if change_invalidator.available else USER_CACHE_TTL_SECONDS
+    user_cache.set(user_id, user_data, ttl=ttl)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    payload = verify_jwt_token(credentials.credentials)
+    if payload.get("typ") == "push":
+        raise HTTPException(status_code=401, detail="Push tokens only open the progress stream")
+    return await load_user(payload["user_id"])
+
+async def load_user(user_id: str) -> User:
+    user_data = user_cache.get(user_id)
+    if user_data is None:
+        user_data = await storage.users.get(user_id)
         if not user_data:
             raise HTTPException(status_code=401, detail="User not found")
-        
-        return User(**user_data)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        cache_user(user_id, user_data)
+    
+    user = User(**user_data)
+    # The stored streak only changes on activity; it has lapsed once a whole day passed without any
+    user.current_streak = activity.stored_streak(user.current_streak, user.last_activity_date)
+    return user
+
+async def get_token_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    # For read-only routes that only need the user's id: access tokens are trusted without a user lookup.
+    # Other fields of the returned User are defaults, not the stored values.
+    payload = verify_jwt_token(credentials.credentials)
+    if payload.get("typ") == "access":
+        return User(id=payload["user_id"], username=payload.get("username", ""), email=payload.get("email", ""))
+    return await get_current_user(credentials)
 
 def calculate_level(total_xp: int) -> int:
     return max(1, total_xp // 100)
@@ -190,109 +406,181 @@ def get_xp_reward(quest_type: QuestType) -> int:
     }
     return rewards.get(quest_type, 10)
 
-async def update_user_xp(user_id: str, xp_gained: int):
-    user_data = await db.users.find_one({"id": user_id})
-    if user_data:
-        new_total_xp = user_data["total_xp"] + xp_gained
-        new_level = calculate_level(new_total_xp)
-        
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"total_xp": new_total_xp, "level": new_level}}
-        )
+# Badge definitions, loaded from the badges collection on startup
+badge_engine = BadgeEngine(DEFAULT_BADGES)
+
+# Number of badges shown on the dashboard
+RECENT_BADGES_LIMIT = 5
+
+async def initialize_badges():
+    await storage.badges.seed([Badge(**badge).dict() for badge in DEFAULT_BADGES])
+    badge_engine.load(await storage.badges.all())
 
-async def update_streak(user_id: str):
-    user_data = await db.users.find_one({"id": user_id})
+async def apply_rewards(user_id: str, xp_gained: int, touch_streak: bool = True,
+                        quests_completed: int = 0) -> Optional[dict]:
+    # XP, level, streak and badges in one atomic update; returns the user's post-image
+    user_data = await storage.users.apply_rewards(user_id, xp_gained, touch_streak, quests_completed,
+                                                  badge_engine.definitions)
     if user_data:
-        today = datetime.now(timezone.utc).date()
-        last_activity = user_data.get("last_activity_date")
-        
-        if last_activity:
-            last_activity_date = last_activity.date() if isinstance(last_activity, datetime) else last_activity
-            
-            if last_activity_date == today:
-                # Already updated today
-                return
-            elif last_activity_date == today - timedelta(days=1):
-                # Continue streak
-                new_streak = user_data["current_streak"] + 1
-            else:
-                # Streak broken, restart
-                new_streak = 1
-        else:
-            # First activity
-            new_streak = 1
-        
-        longest_streak = max(user_data.get("longest_streak", 0), new_streak)
-        
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {
-                "current_streak": new_streak,
-                "longest_streak": longest_streak,
-                "last_activity_date": datetime.now(timezone.utc)
-            }}
-        )
+        cache_user(user_id, dict(user_data))
+        update_leaderboards(user_data)
+        publish_user(user_data)
+    return user_data
 
-async def check_and_award_badges(user_id: str):
-    user_data = await db.users.find_one({"id": user_id})
-    if not user_data:
-        return
-    
-    # Define badge criteria
-    badge_criteria = [
-        {"name": "First Steps", "criteria_type": "xp", "criteria_value": 10, "icon": "🌟"},
-        {"name": "Rising Star", "criteria_type": "xp", "criteria_value": 100, "icon": "⭐"},
-        {"name": "Experience Master", "criteria_type": "xp", "criteria_value": 1000, "icon": "🏆"},
-        {"name": "Streak Starter", "criteria_type": "streak", "criteria_value": 3, "icon": "🔥"},
-        {"name": "Consistency King", "criteria_type": "streak", "criteria_value": 7, "icon": "👑"},
-        {"name": "Dedication Legend", "criteria_type": "streak", "criteria_value": 30, "icon": "🗿"},
-    ]
+def update_leaderboards(user_data: dict):
+    for board, field in LEADERBOARD_FIELDS.items():
+        leaderboards[board].set(user_data["id"], user_data.get(field, 0), user_data.get("username"))
+
+def publish_user(user_data: dict):
+    push_hub.publish(user_data["id"], "user", {field: user_data[field] for field in PUSH_USER_FIELDS if field in user_data})
+
+async def rebuild_leaderboards():
+    # Built aside and swapped in, so periodic rebuilds never serve a half-built board
+    boards = {board: Leaderboard() for board in LEADERBOARD_FIELDS}
+    async for user_data in storage.users.scan(["id", "username", *LEADERBOARD_FIELDS.values()]):
+        for board, field in LEADERBOARD_FIELDS.items():
+            boards[board].set(user_data["id"], user_data.get(field, 0), user_data.get("username"))
+    leaderboards.update(boards)
+
+# Serialization fast path for documents read from our own storage.
+# Reads are limited to the model's fields, missing fields get the model defaults,
+# and the result is handed to orjson without building and re-validating a model per document.
+def model_defaults(model) -> dict:
+    return {
+        name: field.default for name, field in model.model_fields.items()
+        if field.default is not PydanticUndefined
+    }
+
+def trusted_documents(model, docs: list) -> list:
+    defaults = model_defaults(model)
+    return [{**defaults, **doc} for doc in docs]
+
+# Runs handler once per (user, scope, Idempotency-Key); retries and concurrent duplicates get the same outcome
+async def run_idempotent(user_id: str, scope: str, idempotency_key: Optional[str], handler, *args):
+    if not idempotency_key:
+        return await handler(*args)
+    key = IdempotencyStore.digest(user_id, scope, idempotency_key)
+    return await idempotent_requests.run(key, lambda: handler(*args))
+
+# Keyset pagination over (created_at, id)
+def encode_cursor(doc: dict) -> str:
+    raw = f"{doc['created_at'].isoformat()}|{doc['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, item_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split("|", 1)
+        return datetime.fromisoformat(created_at), item_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def list_page(repository, user_id: str, filters: Optional[dict], model,
+                    limit: Optional[int] = None, after: Optional[str] = None, stream: bool = False):
+    # Returns a JSON list (next page cursor in X-Next-Cursor) or an NDJSON stream
+    fields = list(model.model_fields)
+    after_key = decode_cursor(after) if after else None
     
-    current_badges = set(user_data.get("badges", []))
-    new_badges = []
+    if stream:
+        defaults = model_defaults(model)
+        
+        async def ndjson_lines():
+            async for doc in repository.iterate(user_id, fields, filters, after_key, limit):
+                yield orjson.dumps({**defaults, **doc}) + b"\n"
+        
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
     
-    for badge in badge_criteria:
-        if badge["name"] not in current_badges:
-            if badge["criteria_type"] == "xp" and user_data["total_xp"] >= badge["criteria_value"]:
-                new_badges.append(badge["name"])
-            elif badge["criteria_type"] == "streak" and user_data.get("longest_streak", 0) >= badge["criteria_value"]:
-                new_badges.append(badge["name"])
+    if not limit:
+        return ORJSONResponse(trusted_documents(model, await repository.page(user_id, fields, filters, after_key)))
     
-    if new_badges:
-        await db.users.update_one(
-            {"id": user_id},
-            {"$push": {"badges": {"$each": new_badges}}}
-        )
+    # Fetch one extra document to know whether another page exists
+    headers = {}
+    docs = await repository.page(user_id, fields, filters, after_key, limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1])
+    return ORJSONResponse(trusted_documents(model, docs), headers=headers)
 
-# Initialize default side quests
+# Seed default side quests (keyed by slug, once per seed version across workers)
 async def initialize_side_quests():
-    existing = await db.side_quests.count_documents({})
-    if existing == 0:
-        default_side_quests = [
-            {"title": "Take 10 Deep Breaths", "description": "Practice mindful breathing for stress relief", "xp_reward": 8},
-            {"title": "Write 3 Things You're Grateful For", "description": "Practice gratitude to boost positivity", "xp_reward": 8},
-            {"title": "Do 20 Push-ups", "description": "Get your blood pumping with quick exercise", "xp_reward": 8},
-            {"title": "Drink a Full Glass of Water", "description": "Stay hydrated for better health", "xp_reward": 5},
-            {"title": "Tidy Your Workspace", "description": "Create a cleaner environment for productivity", "xp_reward": 8},
-            {"title": "Text Someone You Care About", "description": "Strengthen your social connections", "xp_reward": 8},
-            {"title": "Take a 5-Minute Walk", "description": "Get moving and clear your head", "xp_reward": 8},
-            {"title": "Listen to Your Favorite Song", "description": "Boost your mood with music", "xp_reward": 5},
-        ]
+    await storage.side_quests.seed([SideQuest(**sq).dict() for sq in DEFAULT_SIDE_QUESTS])
+    await refresh_side_quest_catalog()
+
+async def refresh_side_quest_catalog() -> List[SideQuest]:
+    # Sorted by id so the daily pick is stable across workers and reloads
+    side_quests = await storage.side_quests.all()
+    catalog = [SideQuest(**sq) for sq in side_quests]
+    
+    previous = side_quest_catalog.get("all")
+    if previous is not None and [sq.id for sq in previous] != [sq.id for sq in catalog]:
+        # Catalog changed, today's picks may point at removed quests
+        daily_side_quest_picks.clear()
+    
+    side_quest_catalog.set("all", catalog)
+    return catalog
+
+async def get_side_quest_catalog() -> List[SideQuest]:
+    catalog = side_quest_catalog.get("all")
+    if catalog is None:
+        catalog = await refresh_side_quest_catalog()
+    return catalog
+
+def daily_side_quest_index(user_id: Optional[str], day, catalog_size: int) -> int:
+    digest = hashlib.sha256(f"{user_id or ''}:{day.isoformat()}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], "big") % catalog_size
+
+async def pick_daily_side_quest(user_id: Optional[str]) -> Optional[SideQuest]:
+    now = datetime.now(timezone.utc)
+    key = (user_id, now.date())
+    
+    side_quest = daily_side_quest_picks.get(key)
+    if side_quest is None:
+        catalog = await get_side_quest_catalog()
+        if not catalog:
+            return None
+        side_quest = catalog[daily_side_quest_index(user_id, now.date(), len(catalog))]
         
-        for sq in default_side_quests:
-            side_quest = SideQuest(
-                title=sq["title"],
-                description=sq["description"], 
-                xp_reward=sq["xp_reward"]
-            )
-            await db.side_quests.insert_one(side_quest.dict())
+        # Keep the pick until the next UTC midnight
+        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time()).replace(tzinfo=timezone.utc)
+        daily_side_quest_picks.set(key, side_quest, ttl=(tomorrow - now).total_seconds())
+    return side_quest
+
+# Changes made by other workers (or directly in the database) evict what this process cached
+def on_user_change(change: dict):
+    user_data = change.get("fullDocument")
+    if user_data is None:
+        return  # deleted; nothing reads deleted users from the cache for long
+    user_cache.invalidate(user_data["id"])
+    update_leaderboards(user_data)
+    publish_user(user_data)
+
+def on_bad_guy_change(change: dict):
+    bad_guy = change.get("fullDocument")
+    if bad_guy is not None:
+        push_hub.publish(bad_guy["user_id"], f"bad_guy:{bad_guy['id']}",
+                         {"current_hp": bad_guy["current_hp"], "defeat_count": bad_guy.get("defeat_count", 0)})
+
+def on_side_quest_change(change: dict):
+    side_quest_catalog.clear()
+    daily_side_quest_picks.clear()
+
+async def reset_caches():
+    # Events may have been missed
+    user_cache.clear()
+    side_quest_catalog.clear()
+    daily_side_quest_picks.clear()
+    await rebuild_leaderboards()
+
+change_invalidator.subscribe("users", on_user_change, ["id", "username", *LEADERBOARD_FIELDS.values(), *PUSH_USER_FIELDS])
+change_invalidator.subscribe("side_quests", on_side_quest_change)
+# Other workers' hits reach this worker's push streams
+change_invalidator.subscribe("bad_guys", on_bad_guy_change, ["id", "user_id", "current_hp", "defeat_count"])
+change_invalidator.on_reset(reset_caches)
 
 # Auth endpoints
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
-    # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email})
+    # Check if user exists (cheap early exit before hashing the password)
+    existing = await storage.users.get_by_email(user_data.email, ["id"])
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -300,15 +588,21 @@ async def register(user_data: UserCreate):
     user = User(
         email=user_data.email,
         username=user_data.username,
-        password_hash=hash_password(user_data.password)
+        password_hash=await hash_password_async(user_data.password)
     )
     
-    await db.users.insert_one(user.dict())
+    # The unique email index settles concurrent registrations that both passed the check above
+    try:
+        await storage.users.insert(user.dict())
+    except DuplicateError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    cache_user(user.id, user.dict(exclude={"password_hash"}))
+    update_leaderboards(user.dict())
     
     # Create JWT token
     token = create_jwt_token(user.id)
     
-    return {"token": token, "user": {
+    return {"token": token, "access_token": create_access_token(user.id, user.username, user.email), "user": {
         "id": user.id,
         "email": user.email,
         "username": user.username,
@@ -319,109 +613,209 @@ async def register(user_data: UserCreate):
 
 @api_router.post("/auth/login")
 async def login(login_data: UserLogin):
-    user_data = await db.users.find_one({"email": login_data.email})
-    if not user_data or not verify_password(login_data.password, user_data["password_hash"]):
+    user_data = await storage.users.get_by_email(
+        login_data.email,
+        ["id", "email", "username", "total_xp", "level", "current_streak", "last_activity_date", "password_hash"]
+    )
+    if not user_data or not await verify_password_async(login_data.password, user_data["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade hashes created with an outdated cost factor
+    if password_needs_rehash(user_data["password_hash"]):
+        new_hash = await hash_password_async(login_data.password)
+        await storage.users.set_fields(
+            user_data["id"], {"password_hash": new_hash}, expected={"password_hash": user_data["password_hash"]}
+        )
+    
     token = create_jwt_token(user_data["id"])
+    access_token = create_access_token(user_data["id"], user_data["username"], user_data["email"])
     
-    return {"token": token, "user": {
+    return {"token": token, "access_token": access_token, "user": {
         "id": user_data["id"],
         "email": user_data["email"],
         "username": user_data["username"],
         "total_xp": user_data["total_xp"],
         "level": user_data["level"],
-        "current_streak": user_data["current_streak"]
+        "current_streak": activity.stored_streak(user_data["current_streak"], user_data.get("last_activity_date"))
     }}
 
+@api_router.post("/auth/refresh")
+async def refresh_access_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # Exchange the long-lived login token for a short-lived access token
+    if verify_jwt_token(credentials.credentials).get("typ") == "access":
+        raise HTTPException(status_code=401, detail="Access tokens cannot be refreshed")
+    current_user = await get_current_user(credentials)
+    
+    return {
+        "access_token": create_access_token(current_user.id, current_user.username, current_user.email),
+        "expires_in": ACCESS_TOKEN_MINUTES * 60
+    }
+
 # Dashboard endpoint
 @api_router.get("/dashboard")
 async def get_dashboard(current_user: User = Depends(get_current_user)):
     today = datetime.now(timezone.utc).date()
+    today_start = datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)
     
-    # Count today's quests
-    quests_today = await db.quests.count_documents({
-        "user_id": current_user.id,
-        "created_at": {"$gte": datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)}
-    })
-    
-    quests_completed_today = await db.quests.count_documents({
-        "user_id": current_user.id,
-        "status": QuestStatus.DONE,
-        "completed_at": {"$gte": datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)}
-    })
-    
-    # Get random side quest
-    side_quests = await db.side_quests.find().to_list(None)
-    daily_side_quest = None
-    if side_quests:
-        import random
-        daily_side_quest = SideQuest(**random.choice(side_quests))
+    # Count today's created and completed quests and pick today's side quest concurrently
+    (quests_today, quests_completed_today), daily_side_quest = await asyncio.gather(
+        storage.quests.count_today(current_user.id, today_start),
+        pick_daily_side_quest(current_user.id)
+    )
+    
+    # Badges are appended as they are earned, so the newest are at the end
+    recent_badges = [
+        Badge(**badge_engine.by_name[name]) for name in reversed(current_user.badges[-RECENT_BADGES_LIMIT:])
+        if name in badge_engine.by_name
+    ]
     
     return DashboardStats(
         user=current_user,
         quests_today=quests_today,
         quests_completed_today=quests_completed_today,
         daily_side_quest=daily_side_quest,
-        recent_badges=[]
+        recent_badges=recent_badges
     )
 
 # Quest endpoints
 @api_router.get("/quests", response_model=List[Quest])
-async def get_quests(current_user: User = Depends(get_current_user)):
-    quests = await db.quests.find({"user_id": current_user.id}).to_list(None)
-    return [Quest(**quest) for quest in quests]
+async def get_quests(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    status: Optional[QuestStatus] = None,
+    quest_type: Optional[QuestType] = None,
+    stream: bool = False,
+    current_user: User = Depends(get_token_user)
+):
+    filters = {}
+    if status:
+        filters["status"] = status
+    if quest_type:
+        filters["quest_type"] = quest_type
+    return await list_page(storage.quests, current_user.id, filters, Quest, limit, after, stream)
 
 @api_router.post("/quests", response_model=Quest)
 async def create_quest(quest_data: QuestCreate, current_user: User = Depends(get_current_user)):
-    xp_reward = get_xp_reward(quest_data.quest_type)
+    quest = build_quest(quest_data, current_user.id)
     
-    quest = Quest(
-        user_id=current_user.id,
+    await storage.quests.insert(quest.dict())
+    return quest
+
+def build_quest(quest_data: QuestCreate, user_id: str) -> Quest:
+    return Quest(
+        user_id=user_id,
         title=quest_data.title,
         description=quest_data.description,
         quest_type=quest_data.quest_type,
-        xp_reward=xp_reward,
+        xp_reward=get_xp_reward(quest_data.quest_type),
         deadline=quest_data.deadline
     )
+
+# Batch endpoints are registered before /quests/{quest_id}/... so "batch" is not taken as an id
+@api_router.post("/quests/batch")
+async def create_quests_batch(items: List[dict], current_user: User = Depends(get_current_user)):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} quests per batch")
     
-    await db.quests.insert_one(quest.dict())
-    return quest
+    # Validate each item on its own so one bad item does not reject the batch
+    results = [None] * len(items)
+    quests = []
+    for index, item in enumerate(items):
+        try:
+            quests.append((index, build_quest(QuestCreate(**item), current_user.id)))
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "invalid", "errors": e.errors(include_url=False, include_context=False)}
+    
+    failed = {}
+    if quests:
+        failed = await storage.quests.insert_many([quest.dict() for _, quest in quests])
+    
+    for position, (index, quest) in enumerate(quests):
+        if position in failed:
+            results[index] = {"index": index, "status": "error", "detail": failed[position]}
+        else:
+            results[index] = {"index": index, "status": "created", "quest": quest}
+    
+    return {"created": len(quests) - len(failed), "results": results}
+
+@api_router.put("/quests/batch/complete")
+async def complete_quests_batch(batch: QuestBatchComplete, current_user: User = Depends(get_current_user)):
+    quest_ids = list(dict.fromkeys(batch.quest_ids))
+    completed_at = datetime.now(timezone.utc)
+    
+    # Claim every quest that is not done yet at once; "claimed" tells us which ones this request got
+    found = await storage.quests.complete_many(current_user.id, quest_ids, completed_at)
+    
+    results = []
+    total_xp = 0
+    completed = 0
+    for quest_id in quest_ids:
+        quest = found.get(quest_id)
+        if quest is None:
+            results.append({"id": quest_id, "status": "not_found"})
+        elif quest["claimed"]:
+            results.append({"id": quest_id, "status": "completed", "xp_gained": quest["xp_reward"]})
+            total_xp += quest["xp_reward"]
+            completed += 1
+        else:
+            results.append({"id": quest_id, "status": "already_completed"})
+    
+    # One reward update for the whole batch
+    user_data = None
+    if completed:
+        user_data, _, _ = await asyncio.gather(
+            apply_rewards(current_user.id, total_xp, quests_completed=completed),
+            storage.daily_stats.record(current_user.id, xp=total_xp, quest_xp=total_xp, quests_completed=completed),
+            storage.activity_days.mark_active(current_user.id)
+        )
+        XP_AWARDED.labels("quest").inc(total_xp)
+        QUESTS_COMPLETED.inc(completed)
+    
+    return {"completed": completed, "xp_gained": total_xp, "results": results, "user": user_data}
 
 @api_router.put("/quests/{quest_id}/complete")
-async def complete_quest(quest_id: str, current_user: User = Depends(get_current_user)):
-    quest_data = await db.quests.find_one({"id": quest_id, "user_id": current_user.id})
-    if not quest_data:
+async def complete_quest(
+    quest_id: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: User = Depends(get_current_user)
+):
+    return await run_idempotent(current_user.id, f"quests/{quest_id}/complete", idempotency_key,
+                                award_quest_completion, quest_id, current_user)
+
+async def award_quest_completion(quest_id: str, current_user: User):
+    # Only a quest that is not done yet can be claimed, so concurrent completions award XP once
+    xp_reward = await storage.quests.complete(current_user.id, quest_id, datetime.now(timezone.utc))
+    if xp_reward is None:
+        if await storage.quests.get(current_user.id, quest_id, ["id"]):
+            raise HTTPException(status_code=400, detail="Quest already completed")
         raise HTTPException(status_code=404, detail="Quest not found")
     
-    if quest_data["status"] == QuestStatus.DONE:
-        raise HTTPException(status_code=400, detail="Quest already completed")
-    
-    # Update quest
-    await db.quests.update_one(
-        {"id": quest_id},
-        {"$set": {"status": QuestStatus.DONE, "completed_at": datetime.now(timezone.utc)}}
+    # Award XP, update streak and badges in one atomic update
+    user_data, _, _ = await asyncio.gather(
+        apply_rewards(current_user.id, xp_reward, quests_completed=1),
+        storage.daily_stats.record(current_user.id, xp=xp_reward, quest_xp=xp_reward, quests_completed=1),
+        storage.activity_days.mark_active(current_user.id)
     )
+    XP_AWARDED.labels("quest").inc(xp_reward)
+    QUESTS_COMPLETED.inc()
     
-    # Award XP and update streak
-    await update_user_xp(current_user.id, quest_data["xp_reward"])
-    await update_streak(current_user.id)
-    await check_and_award_badges(current_user.id)
-    
-    return {"message": "Quest completed!", "xp_gained": quest_data["xp_reward"]}
+    return {"message": "Quest completed!", "xp_gained": xp_reward, "user": user_data}
 
 @api_router.delete("/quests/{quest_id}")
 async def delete_quest(quest_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.quests.delete_one({"id": quest_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
+    if not await storage.quests.delete(current_user.id, quest_id):
         raise HTTPException(status_code=404, detail="Quest not found")
     return {"message": "Quest deleted"}
 
 # Power-up endpoints
 @api_router.get("/power-ups", response_model=List[PowerUp])
-async def get_power_ups(current_user: User = Depends(get_current_user)):
-    power_ups = await db.power_ups.find({"user_id": current_user.id}).to_list(None)
-    return [PowerUp(**power_up) for power_up in power_ups]
+async def get_power_ups(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: User = Depends(get_token_user)
+):
+    return await list_page(storage.power_ups, current_user.id, None, PowerUp, limit, after, stream)
 
 @api_router.post("/power-ups", response_model=PowerUp)
 async def create_power_up(power_up_data: PowerUpCreate, current_user: User = Depends(get_current_user)):
@@ -431,12 +825,20 @@ async def create_power_up(power_up_data: PowerUpCreate, current_user: User = Dep
         description=power_up_data.description
     )
     
-    await db.power_ups.insert_one(power_up.dict())
+    await storage.power_ups.insert(power_up.dict())
     return power_up
 
 @api_router.post("/power-ups/{power_up_id}/log")
-async def log_power_up(power_up_id: str, current_user: User = Depends(get_current_user)):
-    power_up_data = await db.power_ups.find_one({"id": power_up_id, "user_id": current_user.id})
+async def log_power_up(
+    power_up_id: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: User = Depends(get_current_user)
+):
+    return await run_idempotent(current_user.id, f"power-ups/{power_up_id}/log", idempotency_key,
+                                award_power_up_log, power_up_id, current_user)
+
+async def award_power_up_log(power_up_id: str, current_user: User):
+    power_up_data = await storage.power_ups.get(current_user.id, power_up_id, ["xp_reward"])
     if not power_up_data:
         raise HTTPException(status_code=404, detail="Power-up not found")
     
@@ -445,19 +847,27 @@ async def log_power_up(power_up_id: str, current_user: User = Depends(get_curren
         user_id=current_user.id,
         power_up_id=power_up_id
     )
-    await db.power_up_logs.insert_one(power_up_log.dict())
+    await activity_log_writer.put("power_up_logs", power_up_log.dict())
     
-    # Award XP
-    await update_user_xp(current_user.id, power_up_data["xp_reward"])
-    await check_and_award_badges(current_user.id)
+    # Award XP (with level and badges) in one atomic update; power-ups don't count towards the streak
+    await asyncio.gather(
+        apply_rewards(current_user.id, power_up_data["xp_reward"], touch_streak=False),
+        storage.daily_stats.record(current_user.id, xp=power_up_data["xp_reward"],
+                                   power_up_xp=power_up_data["xp_reward"], power_ups_logged=1)
+    )
+    XP_AWARDED.labels("power_up").inc(power_up_data["xp_reward"])
     
     return {"message": "Power-up logged!", "xp_gained": power_up_data["xp_reward"]}
 
 # Bad guy endpoints
 @api_router.get("/bad-guys", response_model=List[BadGuy])
-async def get_bad_guys(current_user: User = Depends(get_current_user)):
-    bad_guys = await db.bad_guys.find({"user_id": current_user.id}).to_list(None)
-    return [BadGuy(**bad_guy) for bad_guy in bad_guys]
+async def get_bad_guys(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    current_user: User = Depends(get_token_user)
+):
+    return await list_page(storage.bad_guys, current_user.id, None, BadGuy, limit, after, stream)
 
 @api_router.post("/bad-guys", response_model=BadGuy)
 async def create_bad_guy(bad_guy_data: BadGuyCreate, current_user: User = Depends(get_current_user)):
@@ -469,73 +879,184 @@ async def create_bad_guy(bad_guy_data: BadGuyCreate, current_user: User = Depend
         current_hp=bad_guy_data.max_hp
     )
     
-    await db.bad_guys.insert_one(bad_guy.dict())
+    await storage.bad_guys.insert(bad_guy.dict())
     return bad_guy
 
 @api_router.post("/bad-guys/{bad_guy_id}/defeat")
-async def defeat_bad_guy(bad_guy_id: str, damage: int = 10, current_user: User = Depends(get_current_user)):
-    bad_guy_data = await db.bad_guys.find_one({"id": bad_guy_id, "user_id": current_user.id})
+async def defeat_bad_guy(bad_guy_id: str, damage: int = Query(10, ge=1), current_user: User = Depends(get_current_user)):
+    # Deal damage, detect the kill and respawn in one atomic update so concurrent hits all land
+    bad_guy_data = await storage.bad_guys.hit(current_user.id, bad_guy_id, damage)
     if not bad_guy_data:
         raise HTTPException(status_code=404, detail="Bad guy not found")
+    push_hub.publish(current_user.id, f"bad_guy:{bad_guy_id}",
+                     {"current_hp": bad_guy_data["current_hp"], "defeat_count": bad_guy_data["defeat_count"]})
     
-    # Deal damage
-    new_hp = max(0, bad_guy_data["current_hp"] - damage)
-    
-    # Log the defeat attempt
     defeat_log = BadGuyDefeat(
         user_id=current_user.id,
         bad_guy_id=bad_guy_id,
         damage_dealt=damage
     )
-    await db.bad_guy_defeats.insert_one(defeat_log.dict())
     
-    # Update bad guy HP
-    await db.bad_guys.update_one(
-        {"id": bad_guy_id},
-        {"$set": {"current_hp": new_hp}}
+    # Log the hit and award XP (with badges) concurrently
+    await asyncio.gather(
+        activity_log_writer.put("bad_guy_defeats", defeat_log.dict()),
+        apply_rewards(current_user.id, bad_guy_data["defeat_xp_reward"], touch_streak=False),
+        storage.daily_stats.record(
+            current_user.id,
+            xp=bad_guy_data["defeat_xp_reward"],
+            bad_guy_xp=bad_guy_data["defeat_xp_reward"],
+            bad_guy_hits=1,
+            bad_guys_defeated=1 if bad_guy_data["defeated"] else 0
+        )
     )
     
-    # Award XP
-    await update_user_xp(current_user.id, bad_guy_data["defeat_xp_reward"])
-    await check_and_award_badges(current_user.id)
+    XP_AWARDED.labels("bad_guy").inc(bad_guy_data["defeat_xp_reward"])
     
-    # If defeated, reset HP
-    if new_hp == 0:
-        await db.bad_guys.update_one(
-            {"id": bad_guy_id},
-            {"$set": {"current_hp": bad_guy_data["max_hp"]}}
-        )
+    if bad_guy_data["defeated"]:
         return {"message": "Bad guy defeated! It has respawned.", "xp_gained": bad_guy_data["defeat_xp_reward"]}
     
-    return {"message": f"Dealt {damage} damage!", "xp_gained": bad_guy_data["defeat_xp_reward"], "remaining_hp": new_hp}
+    return {"message": f"Dealt {damage} damage!", "xp_gained": bad_guy_data["defeat_xp_reward"], "remaining_hp": bad_guy_data["current_hp"]}
+
+# Progress stream (server-sent events): the caller's XP, level, streaks, badges and bad-guy HP as they change.
+# EventSource cannot set headers, so browsers get a push token from POST /api/push/token and pass it as ?token=.
+# It is checked when the stream connects; fetch a new one before reconnecting.
+@api_router.post("/push/token")
+async def create_push_stream_token(current_user: User = Depends(get_current_user)):
+    return {"token": create_push_token(current_user.id), "expires_in": PUSH_TOKEN_SECONDS}
+
+@api_router.get("/push")
+async def push_updates(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    if credentials is not None:
+        current_user = await get_current_user(credentials)
+    elif token:
+        # Only push tokens in the URL, where proxies and access logs may record them
+        payload = verify_jwt_token(token)
+        if payload.get("typ") != "push":
+            raise HTTPException(status_code=401, detail="Pass a push token from POST /api/push/token")
+        current_user = await load_user(payload["user_id"])
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    subscriber = push_hub.subscribe(current_user.id)
+    if subscriber is None:
+        raise HTTPException(status_code=429, detail="Too many open streams")
+    
+    # The first event carries the current state, later ones only what changed
+    subscriber.push("user", {field: getattr(current_user, field) for field in PUSH_USER_FIELDS})
+    
+    async def events():
+        PUSH_CONNECTIONS.inc()
+        try:
+            async for chunk in push_hub.stream(subscriber):
+                yield chunk
+        finally:
+            PUSH_CONNECTIONS.dec()
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Side quest endpoints
 @api_router.get("/side-quests/daily")
-async def get_daily_side_quest():
-    side_quests = await db.side_quests.find().to_list(None)
-    if not side_quests:
-        return None
+async def get_daily_side_quest(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    # Anonymous callers get the global pick of the day
+    user_id = None
+    if credentials:
+        user_id = (await get_current_user(credentials)).id
     
-    import random
-    return SideQuest(**random.choice(side_quests))
+    return await pick_daily_side_quest(user_id)
 
 @api_router.post("/side-quests/complete")
-async def complete_side_quest(current_user: User = Depends(get_current_user)):
+async def complete_side_quest(
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: User = Depends(get_current_user)
+):
+    return await run_idempotent(current_user.id, "side-quests/complete", idempotency_key,
+                                award_side_quest, current_user)
+
+async def award_side_quest(current_user: User):
     # Get today's side quest
-    side_quest = await get_daily_side_quest()
+    side_quest = await pick_daily_side_quest(current_user.id)
     if not side_quest:
         raise HTTPException(status_code=404, detail="No side quest available")
     
-    # Award XP
-    await update_user_xp(current_user.id, side_quest.xp_reward)
-    await check_and_award_badges(current_user.id)
+    # Award XP (with level and badges) in one atomic update
+    await asyncio.gather(
+        apply_rewards(current_user.id, side_quest.xp_reward, touch_streak=False),
+        storage.daily_stats.record(current_user.id, xp=side_quest.xp_reward, side_quests_completed=1)
+    )
+    XP_AWARDED.labels("side_quest").inc(side_quest.xp_reward)
     
     return {"message": "Side quest completed!", "xp_gained": side_quest.xp_reward}
 
-# Initialize data on startup
-@app.on_event("startup")
-async def startup_event():
-    await initialize_side_quests()
+# Leaderboard endpoints
+@api_router.get("/leaderboard")
+async def get_leaderboard(
+    limit: int = Query(10, ge=1, le=MAX_LEADERBOARD_SIZE),
+    by: str = Query("xp", pattern="^(xp|streak)$"),
+    current_user: User = Depends(get_token_user)
+):
+    return {"by": by, "total": len(leaderboards[by]), "entries": leaderboards[by].top(limit)}
+
+@api_router.get("/leaderboard/me")
+async def get_my_rank(
+    by: str = Query("xp", pattern="^(xp|streak)$"),
+    current_user: User = Depends(get_current_user)
+):
+    board = leaderboards[by]
+    if board.rank(current_user.id) is None:
+        # Registered on another worker since this one started
+        update_leaderboards(current_user.model_dump())
+    
+    return {
+        "by": by,
+        "rank": board.rank(current_user.id),
+        "score": board.score(current_user.id),
+        "total": len(board)
+    }
+
+# Progress history, served from the daily rollups only
+@api_router.get("/stats/history")
+async def get_stats_history(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    current_user: User = Depends(get_token_user)
+):
+    to_date = to_date or datetime.now(timezone.utc).date()
+    from_date = from_date or to_date - timedelta(days=DEFAULT_HISTORY_DAYS - 1)
+    if from_date > to_date:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if (to_date - from_date).days >= MAX_HISTORY_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_HISTORY_DAYS} days")
+    
+    days = await storage.daily_stats.history(current_user.id, from_date, to_date)
+    totals = {name: sum(day[name] for day in days) for name in rollups.COUNTERS}
+    return {"from": from_date, "to": to_date, "days": days, "totals": totals}
+
+# Activity calendar (heatmap) and streaks computed from the activity bitmap; the streaks stored on
+# the user stay authoritative (see activity.py)
+@api_router.get("/streak/calendar")
+async def get_streak_calendar(
+    year: Optional[int] = Query(None, ge=2000, le=9999),
+    current_user: User = Depends(get_token_user)
+):
+    today = datetime.now(timezone.utc).date()
+    year = year or today.year
+    
+    # One small document per active year; the longest streak needs all of them
+    bitmaps = await storage.activity_days.load_bitmaps(current_user.id)
+    current_streak, longest_streak = activity.streaks(bitmaps, today)
+    days = activity.active_days({year: bitmaps[year]}) if year in bitmaps else []
+    
+    return {
+        "year": year,
+        "active_days": days,
+        "total_active_days": len(days),
+        "current_streak": current_streak,
+        "longest_streak": longest_streak
+    }
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -546,15 +1067,39 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Outermost middleware so the latency histogram covers the whole request
+app.add_middleware(PrometheusMiddleware, streaming_paths=["/api/push"])
+
+# Operational endpoints live outside /api, next to /metrics, so that only the
+# monitoring network reaches them when the ingress exposes /api alone
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return metrics_response()
+
+# Cache statistics, used to size the in-process caches
+@app.get("/cache/stats", include_in_schema=False)
+async def get_cache_stats():
+    return {
+        "users": user_cache.stats(),
+        "side_quest_catalog": side_quest_catalog.stats(),
+        "daily_side_quest_picks": daily_side_quest_picks.stats(),
+        "idempotency": idempotent_requests.stats(),
+        "tokens": verified_tokens.stats(),
+        "invalidation": change_invalidator.stats(),
+        "push": push_hub.stats()
+    }
+
+# Storage statistics: Mongo connection pool waits (pool starvation) or SQLite file and WAL sizes
+@app.get("/db/stats", include_in_schema=False)
+async def get_db_stats():
+    return await storage.stats()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
@@ -0,0 +1,666 @@
+"""
+Embedded SQLite storage (STORAGE_BACKEND=sqlite, file at SQLITE_PATH).
+
+The database runs in WAL mode, so readers never block the writer and several
+uvicorn workers can share one file. Each process keeps a single connection on a
+dedicated thread, which keeps queries off the event loop. Writes that read first
+(rewards, bad-guy hits, quest claims) run in BEGIN IMMEDIATE transactions. That
+makes them atomic across workers, like the single-document Mongo updates they
+stand in for.
+
+Datetimes are stored as fixed-width UTC ISO strings so that text order is time
+order. Lists (badges) are stored as JSON. Idempotency outcomes, seed locks and
+change streams are Mongo features: with SQLite, idempotency outcomes are kept
+in process only and caches expire by TTL.
+"""
+
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from enum import Enum
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import activity
+import rollups
+from badges import CRITERIA_FIELDS
+from repositories import DuplicateError, StorageError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    password_hash TEXT NOT NULL DEFAULT '',
+    total_xp INTEGER NOT NULL DEFAULT 0,
+    level INTEGER NOT NULL DEFAULT 1,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    quests_completed INTEGER NOT NULL DEFAULT 0,
+    last_activity_date TEXT,
+    badges TEXT NOT NULL DEFAULT '[]',
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quests (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    quest_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    xp_reward INTEGER NOT NULL,
+    deadline TEXT,
+    created_at TEXT NOT NULL,
+    completed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS quests_user_created_id ON quests (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS quests_user_status_completed ON quests (user_id, status, completed_at);
+CREATE TABLE IF NOT EXISTS power_ups (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    xp_reward INTEGER NOT NULL DEFAULT 5,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS power_ups_user_created_id ON power_ups (user_id, created_at, id);
+CREATE TABLE IF NOT EXISTS bad_guys (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    max_hp INTEGER NOT NULL DEFAULT 100,
+    current_hp INTEGER NOT NULL DEFAULT 100,
+    defeat_xp_reward INTEGER NOT NULL DEFAULT 15,
+    defeat_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bad_guys_user_created_id ON bad_guys (user_id, created_at, id);
+CREATE TABLE IF NOT EXISTS side_quests (
+    id TEXT PRIMARY KEY,
+    slug TEXT UNIQUE,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    xp_reward INTEGER NOT NULL DEFAULT 8
+);
+CREATE TABLE IF NOT EXISTS badges (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    icon TEXT NOT NULL,
+    criteria_type TEXT NOT NULL,
+    criteria_value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS power_up_logs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    power_up_id TEXT NOT NULL,
+    logged_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS power_up_logs_user_logged ON power_up_logs (user_id, logged_at);
+CREATE TABLE IF NOT EXISTS bad_guy_defeats (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    bad_guy_id TEXT NOT NULL,
+    damage_dealt INTEGER NOT NULL,
+    logged_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bad_guy_defeats_user_logged ON bad_guy_defeats (user_id, logged_at);
+CREATE TABLE IF NOT EXISTS daily_stats (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    xp INTEGER NOT NULL DEFAULT 0,
+    quest_xp INTEGER NOT NULL DEFAULT 0,
+    power_up_xp INTEGER NOT NULL DEFAULT 0,
+    bad_guy_xp INTEGER NOT NULL DEFAULT 0,
+    quests_completed INTEGER NOT NULL DEFAULT 0,
+    power_ups_logged INTEGER NOT NULL DEFAULT 0,
+    bad_guy_hits INTEGER NOT NULL DEFAULT 0,
+    bad_guys_defeated INTEGER NOT NULL DEFAULT 0,
+    side_quests_completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS activity_days (
+    user_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    w0 INTEGER NOT NULL DEFAULT 0,
+    w1 INTEGER NOT NULL DEFAULT 0,
+    w2 INTEGER NOT NULL DEFAULT 0,
+    w3 INTEGER NOT NULL DEFAULT 0,
+    w4 INTEGER NOT NULL DEFAULT 0,
+    w5 INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, year)
+) WITHOUT ROWID;
+"""
+
+DATETIME_COLUMNS = {"created_at", "completed_at", "deadline", "last_activity_date", "logged_at"}
+JSON_COLUMNS = {"badges"}
+LOG_TABLES = ("power_up_logs", "bad_guy_defeats")
+
+DONE = "Done"
+
+# Rows fetched per query when iterating over a large result
+SCAN_BATCH_SIZE = 500
+
+
+def _signed64(word: int) -> int:
+    # SQLite integers are signed 64-bit, like the Int64 words activity.py stores in Mongo
+    return word - (1 << 64) if word >= (1 << 63) else word
+
+
+def encode_datetime(value: datetime) -> str:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+def _encode(column: str, value):
+    if value is None:
+        return None
+    if column in DATETIME_COLUMNS:
+        return encode_datetime(value)
+    if column in JSON_COLUMNS:
+        return json.dumps(value)
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _decode_row(row: sqlite3.Row) -> dict:
+    doc = {}
+    for column in row.keys():
+        value = row[column]
+        if value is not None:
+            if column in DATETIME_COLUMNS:
+                value = datetime.fromisoformat(value)
+            elif column in JSON_COLUMNS:
+                value = json.loads(value)
+        doc[column] = value
+    return doc
+
+
+def reward_user(user: dict, xp_gained: int, touch_streak: bool, quests_completed: int,
+                badge_definitions: Iterable[dict], now: datetime) -> dict:
+    """Fields changed by a reward; the Python twin of repositories.build_reward_pipeline."""
+    changes = {"total_xp": (user.get("total_xp") or 0) + xp_gained}
+    changes["level"] = max(1, changes["total_xp"] // 100)
+
+    if quests_completed:
+        changes["quests_completed"] = (user.get("quests_completed") or 0) + quests_completed
+
+    if touch_streak:
+        now = now.astimezone(timezone.utc).replace(tzinfo=None)
+        today_start = datetime.combine(now.date(), dt_time.min)
+        last_activity = user.get("last_activity_date")
+        current_streak = user.get("current_streak") or 0
+        if last_activity is None or last_activity < today_start:
+            if last_activity is not None and last_activity >= today_start - timedelta(days=1):
+                current_streak += 1
+            else:
+                current_streak = 1
+            changes["last_activity_date"] = now
+        changes["current_streak"] = current_streak
+        changes["longest_streak"] = max(user.get("longest_streak") or 0, current_streak)
+
+    # Every badge whose threshold is met and which the user does not hold yet
+    updated = {**user, **changes}
+    badges = list(user.get("badges") or [])
+    for badge in badge_definitions:
+        value = updated.get(CRITERIA_FIELDS[badge["criteria_type"]]) or 0
+        if value >= badge["criteria_value"] and badge["name"] not in badges:
+            badges.append(badge["name"])
+    changes["badges"] = badges
+    return changes
+
+
+@contextmanager
+def _transaction(connection: sqlite3.Connection):
+    # IMMEDIATE takes the write lock up front, so read-then-write is atomic across processes
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+class _Table:
+    """Column-aware helpers shared by the repositories of one table."""
+
+    def __init__(self, storage: "SQLiteStorage", table: str):
+        self.storage = storage
+        self.table = table
+
+    def columns(self, fields: Optional[Iterable[str]] = None, exclude: Iterable[str] = ()) -> List[str]:
+        # Requested fields that exist in the table (e.g. "_id" does not)
+        known = self.storage.columns[self.table]
+        selected = known if fields is None else [field for field in fields if field in known]
+        return [column for column in selected if column not in exclude]
+
+    def insert_row(self, connection: sqlite3.Connection, doc: dict, or_ignore: bool = False) -> None:
+        columns = self.columns(doc)
+        connection.execute(
+            f"INSERT {'OR IGNORE ' if or_ignore else ''}INTO {self.table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            [_encode(column, doc[column]) for column in columns]
+        )
+
+    def select_row(self, connection: sqlite3.Connection, columns: List[str], where: Dict[str, object]) -> Optional[dict]:
+        row = connection.execute(
+            f"SELECT {', '.join(columns) or '1'} FROM {self.table} "
+            f"WHERE {' AND '.join(f'{column} = ?' for column in where)}",
+            [_encode(column, value) for column, value in where.items()]
+        ).fetchone()
+        return _decode_row(row) if row is not None else None
+
+    def update_rows(self, connection: sqlite3.Connection, fields: dict, where: Dict[str, object]) -> int:
+        columns = self.columns(fields)
+        cursor = connection.execute(
+            f"UPDATE {self.table} SET {', '.join(f'{column} = ?' for column in columns)} "
+            f"WHERE {' AND '.join(f'{column} = ?' for column in where)}",
+            [_encode(column, fields[column]) for column in columns]
+            + [_encode(column, value) for column, value in where.items()]
+        )
+        return cursor.rowcount
+
+
+class SQLiteUserRepository(_Table):
+    def __init__(self, storage: "SQLiteStorage"):
+        super().__init__(storage, "users")
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        # Everything but the password hash
+        return await self.storage.run(
+            lambda connection: self.select_row(connection, self.columns(exclude=["password_hash"]), {"id": user_id})
+        )
+
+    async def get_fields(self, user_id: str, fields: Iterable[str]) -> Optional[dict]:
+        return await self.storage.run(lambda connection: self.select_row(connection, self.columns(fields), {"id": user_id}))
+
+    async def get_by_email(self, email: str, fields: Iterable[str]) -> Optional[dict]:
+        return await self.storage.run(lambda connection: self.select_row(connection, self.columns(fields), {"email": email}))
+
+    async def insert(self, doc: dict) -> None:
+        # Raises DuplicateError when the email is already registered
+        try:
+            await self.storage.run(lambda connection: self.insert_row(connection, doc))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateError(str(e)) from e
+
+    async def set_fields(self, user_id: str, fields: dict, expected: Optional[dict] = None) -> bool:
+        return await self.storage.run(
+            lambda connection: self.update_rows(connection, fields, {"id": user_id, **(expected or {})}) > 0
+        )
+
+    async def apply_rewards(self, user_id: str, xp_gained: int, touch_streak: bool,
+                            quests_completed: int, badge_definitions: Iterable[dict]) -> Optional[dict]:
+        # Returns the user's post-image without the password hash
+        definitions = list(badge_definitions)
+        now = datetime.now(timezone.utc)
+
+        def apply(connection):
+            with _transaction(connection):
+                user = self.select_row(connection, self.columns(exclude=["password_hash"]), {"id": user_id})
+                if user is None:
+                    return None
+                changes = reward_user(user, xp_gained, touch_streak, quests_completed, definitions, now)
+                self.update_rows(connection, changes, {"id": user_id})
+                return {**user, **changes}
+
+        return await self.storage.run(apply)
+
+    async def scan(self, fields: Iterable[str]) -> AsyncIterator[dict]:
+        columns = self.columns(fields)
+        last_rowid = 0
+        while True:
+            rows = await self.storage.run(lambda connection: connection.execute(
+                f"SELECT rowid AS _rowid, {', '.join(columns)} FROM users WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, SCAN_BATCH_SIZE)
+            ).fetchall())
+            for row in rows:
+                doc = _decode_row(row)
+                last_rowid = doc.pop("_rowid")
+                yield doc
+            if len(rows) < SCAN_BATCH_SIZE:
+                return
+
+    async def backfill_quests_completed(self, badge_definitions: Iterable[dict]) -> None:
+        # Nothing to do: users.quests_completed has been counted since this backend existed
+        return None
+
+
+class SQLiteItemRepository(_Table):
+    """Items owned by a user (power-ups; base of quests and bad guys)."""
+
+    def _page(self, connection: sqlite3.Connection, user_id: str, columns: List[str], filters: Optional[dict],
+              after: Optional[tuple], limit: Optional[int]) -> List[dict]:
+        clauses = ["user_id = ?"]
+        params = [user_id]
+        for column, value in (filters or {}).items():
+            clauses.append(f"{column} = ?")
+            params.append(_encode(column, value))
+        if after:
+            created_at, item_id = after
+            clauses.append("(created_at > ? OR (created_at = ? AND id > ?))")
+            params += [encode_datetime(created_at), encode_datetime(created_at), item_id]
+        sql = (f"SELECT {', '.join(columns)} FROM {self.table} WHERE {' AND '.join(clauses)} "
+               f"ORDER BY created_at, id")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [_decode_row(row) for row in connection.execute(sql, params)]
+
+    async def page(self, user_id: str, fields: Iterable[str], filters: Optional[dict] = None,
+                   after: Optional[tuple] = None, limit: Optional[int] = None) -> List[dict]:
+        columns = self.columns(fields)
+        return await self.storage.run(lambda connection: self._page(connection, user_id, columns, filters, after, limit))
+
+    async def iterate(self, user_id: str, fields: Iterable[str], filters: Optional[dict] = None,
+                      after: Optional[tuple] = None, limit: Optional[int] = None) -> AsyncIterator[dict]:
+        # Keyset pages, so a long stream never holds a read transaction open
+        columns = list(dict.fromkeys([*self.columns(fields), "created_at", "id"]))
+        requested = set(self.columns(fields))
+        remaining = limit
+        while remaining is None or remaining > 0:
+            batch = SCAN_BATCH_SIZE if remaining is None else min(SCAN_BATCH_SIZE, remaining)
+            docs = await self.page(user_id, columns, filters, after, batch)
+            for doc in docs:
+                yield {column: value for column, value in doc.items() if column in requested}
+            if len(docs) < batch:
+                return
+            after = (docs[-1]["created_at"], docs[-1]["id"])
+            if remaining is not None:
+                remaining -= len(docs)
+
+    async def get(self, user_id: str, item_id: str, fields: Iterable[str]) -> Optional[dict]:
+        return await self.storage.run(
+            lambda connection: self.select_row(connection, self.columns(fields), {"id": item_id, "user_id": user_id})
+        )
+
+    async def insert(self, doc: dict) -> None:
+        await self.storage.run(lambda connection: self.insert_row(connection, doc))
+
+    async def insert_many(self, docs: List[dict]) -> Dict[int, str]:
+        """Insert what can be inserted; returns {position: error message} for the rest."""
+        def insert_all(connection):
+            failed = {}
+            with _transaction(connection):
+                for position, doc in enumerate(docs):
+                    try:
+                        self.insert_row(connection, doc)
+                    except sqlite3.IntegrityError as e:
+                        failed[position] = str(e)
+            return failed
+
+        return await self.storage.run(insert_all)
+
+    async def delete(self, user_id: str, item_id: str) -> bool:
+        return await self.storage.run(lambda connection: connection.execute(
+            f"DELETE FROM {self.table} WHERE id = ? AND user_id = ?", (item_id, user_id)
+        ).rowcount > 0)
+
+
+class SQLiteQuestRepository(SQLiteItemRepository):
+    def __init__(self, storage: "SQLiteStorage"):
+        super().__init__(storage, "quests")
+
+    async def complete(self, user_id: str, quest_id: str, completed_at: datetime) -> Optional[int]:
+        # Only a quest that is not done yet can be claimed, so concurrent completions award XP once
+        def claim(connection):
+            with _transaction(connection):
+                quest = self.select_row(connection, ["xp_reward", "status"], {"id": quest_id, "user_id": user_id})
+                if quest is None or quest["status"] == DONE:
+                    return None
+                self.update_rows(connection, {"status": DONE, "completed_at": completed_at}, {"id": quest_id})
+                return quest["xp_reward"]
+
+        return await self.storage.run(claim)
+
+    async def complete_many(self, user_id: str, quest_ids: List[str], completed_at: datetime) -> Dict[str, dict]:
+        """Complete every listed quest that is not done yet.
+
+        Returns ``{quest_id: {"xp_reward", "claimed"}}`` for the quests found, where
+        ``claimed`` is False for quests that were already done.
+        """
+        def claim(connection):
+            placeholders = ", ".join("?" for _ in quest_ids)
+            with _transaction(connection):
+                found = {
+                    row["id"]: {"xp_reward": row["xp_reward"], "claimed": row["status"] != DONE}
+                    for row in connection.execute(
+                        f"SELECT id, xp_reward, status FROM quests WHERE user_id = ? AND id IN ({placeholders})",
+                        [user_id, *quest_ids]
+                    )
+                }
+                claimed = [quest_id for quest_id, quest in found.items() if quest["claimed"]]
+                if claimed:
+                    connection.execute(
+                        f"UPDATE quests SET status = ?, completed_at = ? WHERE id IN ({', '.join('?' for _ in claimed)})",
+                        [DONE, encode_datetime(completed_at), *claimed]
+                    )
+            return found
+
+        return await self.storage.run(claim) if quest_ids else {}
+
+    async def count_today(self, user_id: str, since: datetime) -> Tuple[int, int]:
+        """(quests created, quests completed) since ``since``; each count is served by its own index."""
+        def count(connection):
+            since_text = encode_datetime(since)
+            created = connection.execute(
+                "SELECT COUNT(*) FROM quests WHERE user_id = ? AND created_at >= ?", (user_id, since_text)
+            ).fetchone()[0]
+            completed = connection.execute(
+                "SELECT COUNT(*) FROM quests WHERE user_id = ? AND status = ? AND completed_at >= ?",
+                (user_id, DONE, since_text)
+            ).fetchone()[0]
+            return created, completed
+
+        return await self.storage.run(count)
+
+
+class SQLiteBadGuyRepository(SQLiteItemRepository):
+    def __init__(self, storage: "SQLiteStorage"):
+        super().__init__(storage, "bad_guys")
+
+    async def hit(self, user_id: str, bad_guy_id: str, damage: int) -> Optional[dict]:
+        """Deal damage, detect the kill and respawn in one transaction so concurrent hits all land.
+
+        Returns ``current_hp``, ``defeat_count``, ``defeat_xp_reward`` and ``defeated``.
+        """
+        def hit(connection):
+            with _transaction(connection):
+                bad_guy = self.select_row(
+                    connection, ["current_hp", "max_hp", "defeat_xp_reward", "defeat_count"],
+                    {"id": bad_guy_id, "user_id": user_id}
+                )
+                if bad_guy is None:
+                    return None
+                current_hp = bad_guy["current_hp"] - damage
+                defeated = current_hp <= 0
+                changes = {
+                    "current_hp": bad_guy["max_hp"] if defeated else current_hp,
+                    "defeat_count": bad_guy["defeat_count"] + (1 if defeated else 0)
+                }
+                self.update_rows(connection, changes, {"id": bad_guy_id})
+                return {
+                    "current_hp": changes["current_hp"],
+                    "defeat_count": changes["defeat_count"],
+                    "defeat_xp_reward": bad_guy["defeat_xp_reward"],
+                    "defeated": defeated
+                }
+
+        return await self.storage.run(hit)
+
+
+class SQLiteCatalogRepository(_Table):
+    """Seeded reference data (side quests, badges)."""
+
+    def __init__(self, storage: "SQLiteStorage", table: str, key: str, order_by: str):
+        super().__init__(storage, table)
+        self.key = key
+        self.order_by = order_by
+
+    async def seed(self, defaults: List[dict]) -> None:
+        # Upserts on the unique key: the seed owns the fields of the defaults, the id is kept once created
+        def seed(connection):
+            with _transaction(connection):
+                for doc in defaults:
+                    columns = self.columns(doc)
+                    updated = [column for column in columns if column not in (self.key, "id")]
+                    connection.execute(
+                        f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                        f"ON CONFLICT ({self.key}) DO UPDATE SET "
+                        f"{', '.join(f'{column} = excluded.{column}' for column in updated)}",
+                        [_encode(column, doc[column]) for column in columns]
+                    )
+
+        await self.storage.run(seed)
+
+    async def all(self) -> List[dict]:
+        return await self.storage.run(lambda connection: [
+            _decode_row(row) for row in connection.execute(f"SELECT * FROM {self.table} ORDER BY {self.order_by}")
+        ])
+
+
+class SQLiteLogRepository:
+    """Append-only activity logs (power_up_logs, bad_guy_defeats), written by the write-behind buffer."""
+
+    def __init__(self, storage: "SQLiteStorage"):
+        self.storage = storage
+        self.tables = {table: _Table(storage, table) for table in LOG_TABLES}
+
+    async def insert_many(self, kind: str, docs: List[dict]) -> Dict[int, str]:
+        """Insert what can be inserted; returns {position: error message} for the rest.
+
+        Raises StorageError when the batch may succeed on retry.
+        """
+        table = self.tables[kind]
+
+        def insert_all(connection):
+            # One transaction per batch; ids already written by an earlier attempt are skipped
+            with _transaction(connection):
+                for doc in docs:
+                    table.insert_row(connection, doc, or_ignore=True)
+
+        try:
+            await self.storage.run(insert_all)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+        return {}
+
+
+class SQLiteDailyStatsRepository:
+    def __init__(self, storage: "SQLiteStorage"):
+        self.storage = storage
+
+    async def record(self, user_id: str, **counters: int) -> None:
+        increments = {name: value for name, value in counters.items() if value and name in rollups.COUNTERS}
+        if not increments:
+            return
+        today = rollups.day_key(datetime.now(timezone.utc))
+        columns = list(increments)
+        await self.storage.run(lambda connection: connection.execute(
+            f"INSERT INTO daily_stats (user_id, day, {', '.join(columns)}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (user_id, day) DO UPDATE SET "
+            f"{', '.join(f'{column} = {column} + excluded.{column}' for column in columns)}",
+            [user_id, today, *increments.values()]
+        ))
+
+    async def history(self, user_id: str, start: date, end: date) -> List[dict]:
+        rows = await self.storage.run(lambda connection: connection.execute(
+            "SELECT * FROM daily_stats WHERE user_id = ? AND day BETWEEN ? AND ?",
+            (user_id, start.isoformat(), end.isoformat())
+        ).fetchall())
+        return rollups.fill_days({row["day"]: dict(row) for row in rows}, start, end)
+
+
+class SQLiteActivityRepository:
+    def __init__(self, storage: "SQLiteStorage"):
+        self.storage = storage
+
+    async def mark_active(self, user_id: str, day: Optional[date] = None) -> None:
+        day = day or datetime.now(timezone.utc).date()
+        word, mask = activity.day_position(day)
+        await self.storage.run(lambda connection: connection.execute(
+            f"INSERT INTO activity_days (user_id, year, {word}) VALUES (?, ?, ?) "
+            f"ON CONFLICT (user_id, year) DO UPDATE SET {word} = {word} | excluded.{word}",
+            (user_id, day.year, _signed64(mask))
+        ))
+
+    async def load_bitmaps(self, user_id: str, years: Optional[Iterable[int]] = None) -> Dict[int, int]:
+        sql = "SELECT * FROM activity_days WHERE user_id = ?"
+        params = [user_id]
+        if years is not None:
+            years = list(years)
+            sql += f" AND year IN ({', '.join('?' for _ in years)})"
+            params += years
+        rows = await self.storage.run(lambda connection: connection.execute(sql, params).fetchall())
+        return {row["year"]: activity.year_bits(dict(row)) for row in rows}
+
+
+class SQLiteStorage:
+    backend = "sqlite"
+    db = None  # no Mongo database behind this storage
+
+    def __init__(self, path: str):
+        self.path = path
+        # One connection, used only from this thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._connection: Optional[sqlite3.Connection] = None
+        self.columns: Dict[str, List[str]] = {}
+        self.users = SQLiteUserRepository(self)
+        self.quests = SQLiteQuestRepository(self)
+        self.power_ups = SQLiteItemRepository(self, "power_ups")
+        self.bad_guys = SQLiteBadGuyRepository(self)
+        self.side_quests = SQLiteCatalogRepository(self, "side_quests", key="slug", order_by="id")
+        self.badges = SQLiteCatalogRepository(self, "badges", key="id", order_by="rowid")
+        self.logs = SQLiteLogRepository(self)
+        self.daily_stats = SQLiteDailyStatsRepository(self)
+        self.activity_days = SQLiteActivityRepository(self)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # Autocommit; multi-statement writes use explicit transactions
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode = WAL")
+            # WAL + NORMAL only syncs at checkpoints; a power loss may drop the last commits, never corrupts
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA busy_timeout = 5000")
+            connection.execute("PRAGMA temp_store = MEMORY")
+            connection.executescript(SCHEMA)
+            self.columns = {
+                table: [row["name"] for row in connection.execute(f"PRAGMA table_info({table})")]
+                for (table,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            }
+            self._connection = connection
+        return self._connection
+
+    async def run(self, func):
+        """Run ``func(connection)`` on the connection's thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(self._connect()))
+
+    async def prepare(self) -> None:
+        await self.run(lambda connection: None)
+
+    async def close(self) -> None:
+        def close(connection):
+            connection.close()
+            self._connection = None
+
+        if self._connection is not None:
+            await self.run(close)
+        self._executor.shutdown(wait=False)
+
+    async def stats(self) -> dict:
+        def collect(connection):
+            pragma = {name: connection.execute(f"PRAGMA {name}").fetchone()[0]
+                      for name in ("journal_mode", "page_size", "page_count", "freelist_count")}
+            return {"backend": self.backend, "path": self.path, "sqlite_version": sqlite3.sqlite_version, **pragma}
+
+        return await self.run(collect)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from repositories import StorageError
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the stream when the buffer is stopped
+_STOP = object()
+
+
+class WriteBehindBuffer:
+    """Buffers documents in memory and writes them in batches in the background.
+
+    A batch is flushed once it holds ``batch_size`` documents or ``flush_interval``
+    seconds after its first document arrived. ``put`` waits while ``max_size``
+    documents are queued, so a slow database pushes back on callers instead of
+    growing memory. ``stop`` flushes everything still queued.
+
+    ``logs`` is the storage's log repository, which writes one batch per
+    ``insert_many(kind, documents)`` call and returns the documents it rejected.
+    Batches that fail with StorageError are retried.
+    """
+
+    def __init__(self, logs, max_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, max_retries: int = 3):
+        self.logs = logs
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.dropped = 0
+
+    async def put(self, collection: str, document: dict) -> None:
+        await self._queue.put((collection, document))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._writer_done)
+
+    def _writer_done(self, task: asyncio.Task) -> None:
+        # The writer only returns on stop; if it died, queued documents would never be written
+        # and put() would block once the queue is full, so say so and start a new one
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error("Write-behind writer died, restarting it", exc_info=task.exception())
+        if self._task is task:
+            self._task = None
+            self.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+        # Anything enqueued while the writer was finishing
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            await self._flush(leftover)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, dict]]) -> None:
+        by_collection = defaultdict(list)
+        for collection, document in batch:
+            by_collection[collection].append(document)
+
+        for collection, documents in by_collection.items():
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    failed = await self.logs.insert_many(collection, documents)
+                    # Rejected documents will not go away on retry
+                    self.flushed += len(documents) - len(failed)
+                    if failed:
+                        self.dropped += len(failed)
+                        logger.error("Dropped %d %s documents: %s", len(failed), collection, next(iter(failed.values())))
+                    break
+                except StorageError as e:
+                    if attempt == self.max_retries:
+                        self.dropped += len(documents)
+                        logger.error("Dropping %d %s documents after %d attempts: %s",
+                                     len(documents), collection, attempt, e)
+                    else:
+                        logger.warning("Write-behind flush to %s failed (attempt %d): %s", collection, attempt, e)
+                        await asyncio.sleep(0.5 * attempt)
+                except Exception:
+                    # Anything else (e.g. a document that cannot be encoded) will not go away on retry;
+                    # drop the batch rather than let it kill the writer
+                    self.dropped += len(documents)
+                    logger.exception("Dropping %d %s documents", len(documents), collection)
+                    break
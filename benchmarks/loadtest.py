@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Async load test for the backend API.
+Boots backend/server.py with uvicorn against a throwaway database (on a local
+mongod, one started here with --mongod, or a SQLite file with --storage sqlite)
+and drives it with concurrent virtual users. Each user registers, then loops over weighted scenarios until the run ends.
+
+Usage:
+    python benchmarks/loadtest.py [--mix mixed] [--users 50] [--duration 30]
+    python benchmarks/loadtest.py --mongod                    # start a temporary mongod from PATH
+    python benchmarks/loadtest.py --storage sqlite            # embedded SQLite, no mongod needed
+    python benchmarks/loadtest.py --url http://host:8001      # target an already running server
+    python benchmarks/loadtest.py --output run.json --save-baseline benchmarks/baseline.json
+    python benchmarks/loadtest.py --baseline benchmarks/baseline.json [--tolerance 0.2]
+
+With --baseline the exit status is 1 when p95 latency of any request, requests per
+second or the error rate regressed beyond the tolerance. Needs httpx
+(pip install -r benchmarks/requirements.txt).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# Scenario weights per mix
+MIXES = {
+    "mixed": {"dashboard": 40, "quest_crud": 20, "power_up": 15, "bad_guy": 15, "login": 10},
+    "dashboard": {"dashboard": 90, "login": 10},
+    "writes": {"quest_crud": 35, "power_up": 30, "bad_guy": 35},
+    "auth": {"login": 70, "register": 30},
+}
+
+# p95 changes below this many milliseconds are treated as noise
+MIN_LATENCY_DELTA_MS = 2.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = None
+        self.finished = None
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def report(self) -> dict:
+        elapsed = self.finished - self.started
+        requests = {}
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            requests[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "rps": round(len(values) / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                **{f"p{pct}_ms": round(percentile(values, pct) * 1000, 2) for pct in (50, 95, 99)},
+            }
+        everything = sorted(value for values in self.latencies.values() for value in values)
+        total = len(everything)
+        errors = sum(self.errors.values())
+        return {
+            "duration_s": round(elapsed, 2),
+            "total": {
+                "count": total,
+                "errors": errors,
+                "error_rate": round(errors / total, 4) if total else 0.0,
+                "rps": round(total / elapsed, 2),
+                **{f"p{pct}_ms": round(percentile(everything, pct) * 1000, 2) for pct in (50, 95, 99)},
+            },
+            "requests": requests,
+        }
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        self.password = "load-test-password"
+        self.headers = {}
+        self.power_up_id = None
+        self.bad_guy_id = None
+
+    async def request(self, name: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(name, time.perf_counter() - started, False)
+            return None
+        self.recorder.record(name, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    @staticmethod
+    def ok(response: Optional[httpx.Response]) -> bool:
+        return response is not None and response.status_code < 400
+
+    async def register(self) -> bool:
+        response = await self.request("POST /auth/register", "POST", "/api/auth/register", json={
+            "email": self.email, "username": self.email.split("@")[0], "password": self.password
+        })
+        if not self.ok(response):
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        return True
+
+    # Scenarios
+
+    async def login(self):
+        await self.request("POST /auth/login", "POST", "/api/auth/login",
+                           json={"email": self.email, "password": self.password})
+
+    async def register_another(self):
+        # Fresh accounts, without switching this user's session
+        email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+        await self.request("POST /auth/register", "POST", "/api/auth/register", json={
+            "email": email, "username": email.split("@")[0], "password": self.password
+        })
+
+    async def dashboard(self):
+        await self.request("GET /dashboard", "GET", "/api/dashboard")
+
+    async def quest_crud(self):
+        response = await self.request("POST /quests", "POST", "/api/quests", json={
+            "title": "Walk around the block",
+            "description": "Load test quest",
+            "quest_type": self.rng.choice(["Daily", "Weekly", "Epic"]),
+        })
+        await self.request("GET /quests", "GET", "/api/quests", params={"limit": 20})
+        if not self.ok(response):
+            return
+        quest_id = response.json()["id"]
+        await self.request("PUT /quests/{quest_id}/complete", "PUT", f"/api/quests/{quest_id}/complete")
+        await self.request("DELETE /quests/{quest_id}", "DELETE", f"/api/quests/{quest_id}")
+
+    async def power_up(self):
+        if self.power_up_id is None:
+            response = await self.request("POST /power-ups", "POST", "/api/power-ups",
+                                          json={"title": "Drink water", "description": "Load test power-up"})
+            if not self.ok(response):
+                return
+            self.power_up_id = response.json()["id"]
+        await self.request("POST /power-ups/{power_up_id}/log", "POST", f"/api/power-ups/{self.power_up_id}/log")
+
+    async def bad_guy(self):
+        if self.bad_guy_id is None:
+            response = await self.request("POST /bad-guys", "POST", "/api/bad-guys",
+                                          json={"title": "Procrastination", "description": "Load test bad guy", "max_hp": 50})
+            if not self.ok(response):
+                return
+            self.bad_guy_id = response.json()["id"]
+        await self.request("POST /bad-guys/{bad_guy_id}/defeat", "POST", f"/api/bad-guys/{self.bad_guy_id}/defeat")
+
+
+SCENARIOS = {
+    "login": VirtualUser.login,
+    "register": VirtualUser.register_another,
+    "dashboard": VirtualUser.dashboard,
+    "quest_crud": VirtualUser.quest_crud,
+    "power_up": VirtualUser.power_up,
+    "bad_guy": VirtualUser.bad_guy,
+}
+
+
+async def run_user(client, recorder, mix: Dict[str, int], deadline: float, think_time: float, seed: int):
+    rng = random.Random(seed)
+    user = VirtualUser(client, recorder, rng)
+    if not await user.register():
+        return
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        await SCENARIOS[rng.choices(names, weights)[0]](user)
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+
+async def run_load(url: str, mix: Dict[str, int], users: int, duration: float, ramp_up: float,
+                   think_time: float, seed: int) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        recorder.started = time.monotonic()
+        deadline = recorder.started + duration
+
+        async def start_user(index: int):
+            # Spread user start-up over the ramp-up period
+            await asyncio.sleep(ramp_up * index / users)
+            await run_user(client, recorder, mix, deadline, think_time, seed + index)
+
+        await asyncio.gather(*(start_user(i) for i in range(users)))
+        recorder.finished = time.monotonic()
+    return recorder.report()
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, current in report["requests"].items():
+        previous = baseline["requests"].get(name)
+        if previous is None:
+            continue
+        limit = previous["p95_ms"] * (1 + tolerance)
+        if current["p95_ms"] > limit and current["p95_ms"] - previous["p95_ms"] > MIN_LATENCY_DELTA_MS:
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms > {previous['p95_ms']} ms baseline")
+    total, previous = report["total"], baseline["total"]
+    if total["rps"] < previous["rps"] * (1 - tolerance):
+        regressions.append(f"throughput: {total['rps']} rps < {previous['rps']} rps baseline")
+    if total["error_rate"] > previous["error_rate"] + 0.01:
+        regressions.append(f"error rate: {total['error_rate']:.2%} > {previous['error_rate']:.2%} baseline")
+    return regressions
+
+
+def print_report(report: dict):
+    header = f"{'request':<36}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in list(report["requests"].items()) + [("TOTAL", report["total"])]:
+        print(f"{name:<36}{stats['count']:>8}{stats['errors']:>8}{stats['rps']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}")
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[0]} exited with status {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} was not ready after {timeout:.0f}s")
+
+
+def start_mongod(dbpath: str) -> Tuple[subprocess.Popen, str]:
+    if shutil.which("mongod") is None:
+        raise RuntimeError("--mongod needs a mongod binary on PATH")
+    port = free_port()
+    process = subprocess.Popen(
+        ["mongod", "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL
+    )
+    mongo_url = f"mongodb://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"mongod exited with status {process.returncode}")
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return process, mongo_url
+        time.sleep(0.2)
+    raise RuntimeError("mongod did not start")
+
+
+def start_server(mongo_url: str, db_name: str, workers: int, extra_env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {**os.environ, "MONGO_URL": mongo_url, "DB_NAME": db_name, **extra_env}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{url}/metrics", process)
+    return process, url
+
+
+def sqlite_env(directory: str) -> Dict[str, str]:
+    return {"STORAGE_BACKEND": "sqlite", "SQLITE_PATH": str(Path(directory) / "loadtest.sqlite3")}
+
+
+def drop_database(mongo_url: str, db_name: str):
+    from pymongo import MongoClient
+    with MongoClient(mongo_url, serverSelectionTimeoutMS=5000) as mongo:
+        mongo.drop_database(db_name)
+
+
+def stop(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between scenarios (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--storage", choices=["mongo", "sqlite"], default="mongo", help="STORAGE_BACKEND of the started server")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://127.0.0.1:27017"))
+    parser.add_argument("--mongod", action="store_true", help="start a temporary mongod instead of using --mongo-url")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--bcrypt-rounds", type=int, help="BCRYPT_ROUNDS for the started server")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the load test database")
+    parser.add_argument("--output", type=Path, help="write the report as JSON")
+    parser.add_argument("--save-baseline", type=Path, help="write the report as the new baseline")
+    parser.add_argument("--baseline", type=Path, help="compare against a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    mongod = server = None
+    mongo_url = args.mongo_url
+    dbpath = tempfile.mkdtemp(prefix="loadtest-mongod-") if args.mongod and args.storage == "mongo" else None
+    sqlite_dir = tempfile.mkdtemp(prefix="loadtest-sqlite-") if args.storage == "sqlite" else None
+    db_name = f"loadtest_{uuid.uuid4().hex[:8]}"
+    try:
+        url = args.url
+        if url is None:
+            if dbpath:
+                mongod, mongo_url = start_mongod(dbpath)
+            extra_env = {"BCRYPT_ROUNDS": str(args.bcrypt_rounds)} if args.bcrypt_rounds else {}
+            if sqlite_dir:
+                extra_env.update(sqlite_env(sqlite_dir))
+            server, url = start_server(mongo_url, db_name, args.workers, extra_env)
+
+        print(f"{args.users} users, mix {args.mix!r}, {args.duration:.0f}s against {url}")
+        report = asyncio.run(run_load(url, MIXES[args.mix], args.users, args.duration, args.ramp_up,
+                                      args.think_time, args.seed))
+        report["config"] = {"mix": args.mix, "users": args.users, "duration": args.duration,
+                            "think_time": args.think_time, "workers": args.workers, "storage": args.storage}
+    finally:
+        stop(server)
+        if server is not None and not args.keep_db and args.storage == "mongo":
+            drop_database(mongo_url, db_name)
+        stop(mongod)
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+        if sqlite_dir:
+            if args.keep_db:
+                print(f"SQLite database kept in {sqlite_dir}")
+            else:
+                shutil.rmtree(sqlite_dir, ignore_errors=True)
+
+    print_report(report)
+    for path in (args.output, args.save_baseline):
+        if path:
+            path.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("config", {}).get("mix") != args.mix:
+            print(f"warning: baseline was recorded with mix {baseline.get('config', {}).get('mix')!r}")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the domain helpers and data-access functions in server.py.
+
+Each benchmark is warmed up, then timed over --repeat rounds. For CPU-bound
+helpers the iterations per round are calibrated so that a round lasts at least
+--min-round-time. The median time per call is the figure that thresholds and
+baselines are checked against.
+
+The DB-backed helper (apply_rewards) runs against a throwaway SQLite storage
+by default. With --mongo-url it runs against a throwaway database on a real
+server instead.
+The hash_password/verify_password thresholds assume the default BCRYPT_ROUNDS (12).
+
+Usage:
+    python benchmarks/microbench.py [--filter jwt] [--repeat 7] [--output results.json]
+    python benchmarks/microbench.py --mongo-url mongodb://localhost:27017
+    python benchmarks/microbench.py --check                       # fail on benchmarks/microbench_thresholds.json
+    python benchmarks/microbench.py --baseline before.json [--tolerance 0.25]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from repositories import build_reward_pipeline, create_storage  # noqa: E402
+
+THRESHOLDS_FILE = Path(__file__).resolve().parent / "microbench_thresholds.json"
+
+
+class Benchmark:
+    def __init__(self, name: str, func: Callable, is_async: bool = False,
+                 setup: Optional[Callable] = None, number: Optional[int] = None):
+        self.name = name
+        self.func = func
+        self.is_async = is_async
+        # Runs untimed before every round, with the number of calls the round will make
+        self.setup = setup
+        # Fixed calls per round; calibrated when None
+        self.number = number
+
+
+def user_document(user_id: str, **fields) -> dict:
+    return {**server.User(id=user_id, email=f"{user_id}@example.com", username=user_id).dict(), **fields}
+
+
+def build_benchmarks(loop: asyncio.AbstractEventLoop, db_number: int) -> List[Benchmark]:
+    token = server.create_jwt_token("benchmark-user")
+    password_hash = server.hash_password("benchmark-password")
+    quest_doc = server.Quest(user_id="benchmark-user", title="Read 20 pages", description="Personal development",
+                             quest_type=server.QuestType.DAILY, xp_reward=10).dict()
+    user_doc = user_document("benchmark-user")
+    reward_users: List[str] = []
+
+    def uncached_verify():
+        server.verified_tokens.clear()
+        return server.verify_jwt_token(token)
+
+    def reset_reward_users(count: int):
+        # Every call must take the full path: last active yesterday, so the streak continues
+        yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+        reward_users.clear()
+        for _ in range(count):
+            user_id = str(uuid.uuid4())
+            loop.run_until_complete(server.storage.users.insert(
+                user_document(user_id, current_streak=4, longest_streak=4, last_activity_date=yesterday)
+            ))
+            reward_users.append(user_id)
+
+    async def complete_quest_once():
+        # What a quest completion writes: XP, quest count, streak and badges in one update
+        return await server.apply_rewards(reward_users.pop(), 10, touch_streak=True, quests_completed=1)
+
+    async def log_power_up_once():
+        return await server.apply_rewards(reward_users.pop(), 5, touch_streak=False)
+
+    return [
+        Benchmark("calculate_level", lambda: server.calculate_level(12345)),
+        Benchmark("get_xp_reward", lambda: server.get_xp_reward(server.QuestType.EPIC)),
+        Benchmark("create_jwt_token", lambda: server.create_jwt_token("benchmark-user")),
+        Benchmark("verify_jwt_token (cached)", lambda: server.verify_jwt_token(token)),
+        Benchmark("verify_jwt_token (decode)", uncached_verify),
+        Benchmark("hash_password", lambda: server.hash_password("benchmark-password"), number=1),
+        Benchmark("verify_password", lambda: server.verify_password("benchmark-password", password_hash), number=1),
+        Benchmark("Quest(**doc)", lambda: server.Quest(**quest_doc)),
+        Benchmark("User(**doc)", lambda: server.User(**user_doc)),
+        Benchmark("build_reward_pipeline",
+                  lambda: build_reward_pipeline(10, True, 1, server.badge_engine.definitions)),
+        Benchmark("apply_rewards (quest)", complete_quest_once, is_async=True,
+                  setup=reset_reward_users, number=db_number),
+        Benchmark("apply_rewards (power-up)", log_power_up_once, is_async=True,
+                  setup=reset_reward_users, number=db_number),
+    ]
+
+
+def time_round(benchmark: Benchmark, loop: asyncio.AbstractEventLoop, number: int) -> float:
+    if benchmark.setup:
+        benchmark.setup(number)
+    func = benchmark.func
+    if benchmark.is_async:
+        async def calls():
+            start = time.perf_counter()
+            for _ in range(number):
+                await func()
+            return time.perf_counter() - start
+        return loop.run_until_complete(calls())
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def calibrate(benchmark: Benchmark, loop: asyncio.AbstractEventLoop, min_round_time: float) -> int:
+    # Same approach as timeit.autorange
+    number = 1
+    while True:
+        if time_round(benchmark, loop, number) >= min_round_time:
+            return number
+        number *= 10
+
+
+def run(benchmark: Benchmark, loop: asyncio.AbstractEventLoop, repeat: int, warmup: int,
+        min_round_time: float) -> dict:
+    number = benchmark.number or calibrate(benchmark, loop, min_round_time)
+    for _ in range(warmup):
+        time_round(benchmark, loop, number)
+    per_call = [time_round(benchmark, loop, number) / number for _ in range(repeat)]
+    median = statistics.median(per_call)
+    return {
+        "number": number,
+        "repeat": repeat,
+        "min_us": round(min(per_call) * 1e6, 3),
+        "median_us": round(median * 1e6, 3),
+        "mean_us": round(statistics.fmean(per_call) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(per_call) * 1e6, 3) if repeat > 1 else 0.0,
+        "ops_per_s": round(1 / median, 1) if median else None,
+    }
+
+
+def check(results: Dict[str, dict], limits: Dict[str, float], label: str, tolerance: float = 0.0) -> List[str]:
+    failures = []
+    for name, limit in limits.items():
+        if name in results and results[name]["median_us"] > limit * (1 + tolerance):
+            failures.append(f"{name}: median {results[name]['median_us']} us > {label} {limit} us")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=7, help="timed rounds per benchmark")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed rounds per benchmark")
+    parser.add_argument("--min-round-time", type=float, default=0.1, help="seconds, for calibrated benchmarks")
+    parser.add_argument("--db-number", type=int, default=200, help="calls per round for DB-backed benchmarks")
+    parser.add_argument("--mongo-url", help="run DB-backed benchmarks against this server instead of SQLite")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--check", action="store_true", help=f"fail when a median exceeds {THRESHOLDS_FILE.name}")
+    parser.add_argument("--thresholds", type=Path, default=THRESHOLDS_FILE)
+    parser.add_argument("--baseline", type=Path, help="fail when a median regressed against earlier --output")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression for --baseline")
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    backend = "mongo" if args.mongo_url else "sqlite"
+    db_name = f"microbench_{uuid.uuid4().hex[:8]}"
+    temp_dir = tempfile.TemporaryDirectory(prefix="microbench-")
+    environ = {"STORAGE_BACKEND": backend, "SQLITE_PATH": str(Path(temp_dir.name) / "microbench.sqlite3"),
+               "MONGO_URL": args.mongo_url or "", "DB_NAME": db_name}
+    server.storage = create_storage(environ, Path(environ["SQLITE_PATH"]))
+    loop.run_until_complete(server.storage.prepare())
+
+    results = {}
+    try:
+        for benchmark in build_benchmarks(loop, args.db_number):
+            if args.filter and args.filter.lower() not in benchmark.name.lower():
+                continue
+            results[benchmark.name] = stats = run(benchmark, loop, args.repeat, args.warmup, args.min_round_time)
+            print(f"{benchmark.name:<34}{stats['median_us']:>12.3f} us  "
+                  f"(min {stats['min_us']:.3f}, stdev {stats['stdev_us']:.3f}, {stats['number']} x {stats['repeat']})")
+    finally:
+        if args.mongo_url:
+            loop.run_until_complete(server.storage.client.drop_database(db_name))
+        loop.run_until_complete(server.storage.close())
+        loop.close()
+        temp_dir.cleanup()
+
+    if args.output:
+        report = {
+            "backend": backend,
+            "python": sys.version.split()[0],
+            "bcrypt_rounds": server.BCRYPT_ROUNDS,
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    failures = []
+    if args.check:
+        thresholds = json.loads(args.thresholds.read_text())
+        # "common" limits apply to every run, "sqlite"/"mongo" only to DB-backed benchmarks on that backend
+        limits = {**thresholds.get("common", {}), **thresholds.get(backend, {})}
+        failures += check(results, limits, "threshold")
+    if args.baseline:
+        previous = json.loads(args.baseline.read_text())["results"]
+        limits = {name: stats["median_us"] for name, stats in previous.items()}
+        failures += check(results, limits, "baseline", args.tolerance)
+    if failures:
+        print("\nOver budget:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
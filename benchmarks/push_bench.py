@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Fan-out benchmark for the server-push hub (backend/push.py), in process.
+
+Opens --streams idle streams spread over --users users, each drained by a task the
+way StreamingResponse drains it, and reports:
+  - memory per idle stream,
+  - publish cost for a user without streams (the common case on the reward paths)
+    and for a user with streams, until the update has been written,
+  - the time one heartbeat tick takes to wake and write to every stream.
+
+Usage:
+    python benchmarks/push_bench.py [--streams 10000] [--users 5000] [--publishes 20000]
+"""
+
+import argparse
+import asyncio
+import gc
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from push import PushHub  # noqa: E402
+
+
+class Sink:
+    """Stands in for the socket: counts the bytes each stream writes."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.written = asyncio.Event()
+
+    async def drain(self, hub: PushHub, subscriber):
+        async for _ in hub.stream(subscriber):
+            self.chunks += 1
+            self.written.set()
+
+
+async def open_streams(hub: PushHub, streams: int, users: int):
+    sinks, tasks = [], []
+    for index in range(streams):
+        subscriber = hub.subscribe(f"user-{index % users}")
+        sink = Sink()
+        sinks.append(sink)
+        tasks.append(asyncio.create_task(sink.drain(hub, subscriber)))
+    # Let every stream write its retry line and go idle
+    await asyncio.sleep(0)
+    while not all(sink.chunks for sink in sinks):
+        await asyncio.sleep(0.01)
+    return sinks, tasks
+
+
+async def main(args):
+    hub = PushHub(heartbeat_interval=3600, max_per_user=max(1, -(-args.streams // args.users)))
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sinks, tasks = await open_streams(hub, args.streams, args.users)
+    gc.collect()
+    per_stream = (tracemalloc.get_traced_memory()[0] - before) / args.streams
+    tracemalloc.stop()
+    print(f"{args.streams} idle streams over {args.users} users: {per_stream / 1024:.2f} KiB per stream")
+
+    started = time.perf_counter()
+    for index in range(args.publishes):
+        hub.publish(f"nobody-{index}", "user", {"total_xp": index})
+    per_call = (time.perf_counter() - started) / args.publishes
+    print(f"publish, no open stream:        {per_call * 1e6:8.3f} us")
+
+    # One user at a time so each update is written before the next is published
+    latencies = []
+    for index in range(min(args.publishes, args.users)):
+        sink = sinks[index]
+        sink.written.clear()
+        started = time.perf_counter()
+        hub.publish(f"user-{index}", "user", {"total_xp": index + 1, "level": 1})
+        await sink.written.wait()
+        latencies.append(time.perf_counter() - started)
+    print(f"publish to written, median:     {statistics.median(latencies) * 1e6:8.3f} us "
+          f"(p99 {sorted(latencies)[int(len(latencies) * 0.99)] * 1e6:.3f} us, "
+          f"{hub.stats()['connections'] // args.users} streams per user)")
+
+    # One heartbeat tick: wake every stream and write the comment line
+    written = sum(sink.chunks for sink in sinks)
+    started = time.perf_counter()
+    hub.ping()
+    while sum(sink.chunks for sink in sinks) < written + args.streams:
+        await asyncio.sleep(0)
+    print(f"heartbeat to all streams:       {(time.perf_counter() - started) * 1e3:8.3f} ms")
+
+    await hub.stop()
+    await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--streams", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--publishes", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for list endpoints.
+Compares the per-item cost of returning a 5,000-quest list through the old path
+(Quest(**doc) per document, response_model re-validation, jsonable_encoder, JSONResponse)
+with the current fast path (projected documents + model defaults + ORJSONResponse).
+
+Usage: python benchmarks/serialization_bench.py [--items 5000] [--repeat 10]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+
+def make_quest_documents(count: int) -> list:
+    # Shaped like documents returned by storage.quests.page(..., fields=Quest.model_fields)
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": "benchmark-user",
+            "title": f"Read 20 pages ({i})",
+            "description": "Read 20 pages of a personal development book",
+            "quest_type": ["Daily", "Weekly", "Epic"][i % 3],
+            "status": "Done" if i % 2 else "To Do",
+            "xp_reward": [10, 25, 50][i % 3],
+            "deadline": None,
+            "created_at": start + timedelta(minutes=i),
+            "completed_at": start + timedelta(minutes=i, seconds=30) if i % 2 else None,
+        }
+        for i in range(count)
+    ]
+
+
+response_field = create_response_field(name="Response_get_quests", type_=List[server.Quest])
+
+
+async def old_path(docs: list) -> bytes:
+    content = [server.Quest(**doc) for doc in docs]
+    body = await serialize_response(field=response_field, response_content=content, is_coroutine=True)
+    return JSONResponse(body).body
+
+
+async def fast_path(docs: list) -> bytes:
+    return ORJSONResponse(server.trusted_documents(server.Quest, docs)).body
+
+
+def measure(func, docs: list, repeat: int) -> float:
+    asyncio.run(func(docs))  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        asyncio.run(func(docs))
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    docs = make_quest_documents(args.items)
+
+    # Both paths must produce the same JSON
+    same = json.loads(asyncio.run(old_path(docs))) == json.loads(asyncio.run(fast_path(docs)))
+    print(f"Identical output: {same}")
+
+    results = {}
+    for name, func in [("before", old_path), ("after", fast_path)]:
+        seconds = measure(func, docs, args.repeat)
+        results[name] = seconds
+        print(f"{name:>6}: {seconds * 1000:8.1f} ms per list, {seconds / args.items * 1e6:6.2f} us per item")
+
+    print(f"speedup: {results['before'] / results['after']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Side-by-side load test of the storage backends (MongoDB and embedded SQLite).
+
+Runs the same load test (see loadtest.py) once per backend, each against a fresh
+server and a throwaway database, and prints latency and throughput per request
+next to each other. The last column is SQLite p95 relative to Mongo p95.
+
+Usage:
+    python benchmarks/storage_bench.py [--mix mixed] [--users 50] [--duration 30]
+    python benchmarks/storage_bench.py --mongod               # start a temporary mongod from PATH
+    python benchmarks/storage_bench.py --backends sqlite      # only one backend
+    python benchmarks/storage_bench.py --output storage.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Dict
+
+from loadtest import (MIXES, drop_database, print_report, run_load, sqlite_env, start_mongod,
+                      start_server, stop)
+
+BACKENDS = ("mongo", "sqlite")
+
+
+def run_backend(backend: str, args) -> dict:
+    mongod = server = None
+    mongo_url = args.mongo_url
+    db_name = f"storagebench_{uuid.uuid4().hex[:8]}"
+    workdir = tempfile.mkdtemp(prefix=f"storagebench-{backend}-")
+    try:
+        extra_env = {"BCRYPT_ROUNDS": str(args.bcrypt_rounds)} if args.bcrypt_rounds else {}
+        if backend == "sqlite":
+            extra_env.update(sqlite_env(workdir))
+        elif args.mongod:
+            mongod, mongo_url = start_mongod(workdir)
+        server, url = start_server(mongo_url, db_name, args.workers, extra_env)
+
+        print(f"\n{backend}: {args.users} users, mix {args.mix!r}, {args.duration:.0f}s against {url}")
+        report = asyncio.run(run_load(url, MIXES[args.mix], args.users, args.duration, args.ramp_up,
+                                      args.think_time, args.seed))
+    finally:
+        stop(server)
+        if server is not None and backend == "mongo" and not args.mongod:
+            drop_database(mongo_url, db_name)
+        stop(mongod)
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_report(report)
+    return report
+
+
+def print_comparison(reports: Dict[str, dict]):
+    backends = list(reports)
+    header = f"{'request':<36}" + "".join(f"{b + ' p50':>13}{b + ' p95':>13}{b + ' rps':>13}" for b in backends)
+    if len(backends) == 2:
+        header += f"{'p95 ratio':>11}"
+    print("\n" + header)
+    print("-" * len(header))
+
+    names = sorted({name for report in reports.values() for name in report["requests"]})
+    for name in names + ["TOTAL"]:
+        rows = [report["total"] if name == "TOTAL" else report["requests"].get(name) for report in reports.values()]
+        line = f"{name:<36}"
+        for stats in rows:
+            if stats is None:
+                line += f"{'-':>13}" * 3
+            else:
+                line += f"{stats['p50_ms']:>13.1f}{stats['p95_ms']:>13.1f}{stats['rps']:>13.1f}"
+        if len(rows) == 2 and all(rows) and rows[0]["p95_ms"]:
+            line += f"{rows[1]['p95_ms'] / rows[0]['p95_ms']:>10.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load per backend")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between scenarios (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://127.0.0.1:27017"))
+    parser.add_argument("--mongod", action="store_true", help="start a temporary mongod instead of using --mongo-url")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--bcrypt-rounds", type=int, help="BCRYPT_ROUNDS for the started servers")
+    parser.add_argument("--output", type=Path, help="write both reports as JSON")
+    args = parser.parse_args()
+
+    reports = {backend: run_backend(backend, args) for backend in args.backends}
+    print_comparison(reports)
+
+    if args.output:
+        config = {"mix": args.mix, "users": args.users, "duration": args.duration,
+                  "think_time": args.think_time, "workers": args.workers}
+        args.output.write_text(json.dumps({"config": config, "reports": reports}, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+A small evaluator of the update-pipeline stages and aggregation operators the
+repositories build, so tests can check them without MongoDB.
+"""
+
+import math
+from datetime import datetime, timezone
+
+_MISSING = object()
+
+
+def _bson_rank(value) -> int:
+    # Comparison order of BSON types: null < numbers < strings < arrays < booleans < dates
+    if value is None or value is _MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 4
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, list):
+        return 3
+    return 5
+
+
+def _naive(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _gte(left, right) -> bool:
+    left, right = _naive(left), _naive(right)
+    if _bson_rank(left) != _bson_rank(right):
+        return _bson_rank(left) > _bson_rank(right)
+    return left is None or left is _MISSING or left >= right
+
+
+def evaluate(expression, doc: dict, variables: dict):
+    if isinstance(expression, str):
+        if expression.startswith("$$"):
+            return variables[expression[2:]]
+        if expression.startswith("$"):
+            return doc.get(expression[1:], _MISSING)
+        return expression
+    if isinstance(expression, list):
+        return [evaluate(item, doc, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+
+    (operator, argument), = expression.items()
+
+    def arg(index):
+        return evaluate(argument[index], doc, variables)
+
+    if operator == "$add":
+        return sum(evaluate(argument, doc, variables))
+    if operator == "$ifNull":
+        value = arg(0)
+        return arg(1) if value is None or value is _MISSING else value
+    if operator == "$max":
+        return max(value for value in evaluate(argument, doc, variables) if value not in (None, _MISSING))
+    if operator == "$subtract":
+        return arg(0) - arg(1)
+    if operator == "$divide":
+        return arg(0) / arg(1)
+    if operator == "$floor":
+        return math.floor(evaluate(argument, doc, variables))
+    if operator == "$toInt":
+        return int(evaluate(argument, doc, variables))
+    if operator == "$gte":
+        return _gte(arg(0), arg(1))
+    if operator == "$ne":
+        return arg(0) != arg(1)
+    if operator == "$and":
+        return all(evaluate(argument, doc, variables))
+    if operator == "$not":
+        return not arg(0)
+    if operator == "$in":
+        return arg(0) in arg(1)
+    if operator == "$cond":
+        return arg(1) if arg(0) else arg(2)
+    if operator == "$switch":
+        for branch in argument["branches"]:
+            if evaluate(branch["case"], doc, variables):
+                return evaluate(branch["then"], doc, variables)
+        return evaluate(argument["default"], doc, variables)
+    if operator == "$concatArrays":
+        return [item for array in evaluate(argument, doc, variables) for item in array]
+    if operator == "$filter":
+        return [
+            item for item in evaluate(argument["input"], doc, variables)
+            if evaluate(argument["cond"], doc, {**variables, "this": item})
+        ]
+    raise NotImplementedError(operator)
+
+
+def run_pipeline(pipeline: list, doc: dict) -> dict:
+    doc = dict(doc)
+    for stage in pipeline:
+        (operator, fields), = stage.items()
+        assert operator == "$set"
+        # Every field of a stage is computed from the document as it was before the stage
+        values = {field: evaluate(expression, doc, {}) for field, expression in fields.items()}
+        doc.update(values)
+    return {field: _naive(value) for field, value in doc.items() if value is not _MISSING}
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta, timezone
+
+from activity import active_days, combine, day_position, longest_run, stored_streak, streaks, year_bits
+
+
+def bitmaps(*days: date) -> dict:
+    result = {}
+    for day in days:
+        result[day.year] = result.get(day.year, 0) | (1 << (day.timetuple().tm_yday - 1))
+    return result
+
+
+def run(start: date, length: int) -> list:
+    return [start + timedelta(days=offset) for offset in range(length)]
+
+
+def test_day_position_last_day_of_leap_year():
+    # Day 366 is bit 365: word 5, bit 45
+    assert day_position(date(2024, 12, 31)) == ("w5", 1 << 45)
+
+
+def test_year_bits_reads_negative_words():
+    # Mongo hands back the high bit of a word as a negative Int64
+    assert year_bits({"w0": -1}) == (1 << 64) - 1
+    assert year_bits({"w5": 1 << 45}) == 1 << (5 * 64 + 45)
+
+
+def test_combine_offsets_later_years():
+    origin, bits = combine(bitmaps(date(2023, 12, 31), date(2024, 1, 1)))
+    assert origin == date(2023, 1, 1)
+    assert bits == 0b11 << 364
+
+
+def test_streak_across_new_year():
+    days = run(date(2023, 12, 29), 5)
+    assert streaks(bitmaps(*days), today=date(2024, 1, 2)) == (5, 5)
+
+
+def test_streak_across_leap_year_end():
+    # 2024 has 366 days, so Dec 31 is bit 365 and Jan 1 2025 must follow it directly
+    days = run(date(2024, 12, 30), 4)
+    assert streaks(bitmaps(*days), today=date(2025, 1, 2)) == (4, 4)
+
+
+def test_streak_ending_yesterday_is_current():
+    days = run(date(2023, 12, 30), 3)
+    assert streaks(bitmaps(*days), today=date(2024, 1, 2)) == (3, 3)
+
+
+def test_streak_ending_before_yesterday_is_broken():
+    days = run(date(2023, 12, 30), 3)
+    assert streaks(bitmaps(*days), today=date(2024, 1, 3)) == (0, 3)
+
+
+def test_current_streak_starts_after_gap():
+    days = run(date(2023, 12, 20), 6) + run(date(2023, 12, 30), 3)
+    assert streaks(bitmaps(*days), today=date(2024, 1, 1)) == (3, 6)
+
+
+def test_streak_from_first_day_of_calendar():
+    # No zero below the run: the run reaches the origin
+    days = run(date(2024, 1, 1), 10)
+    assert streaks(bitmaps(*days), today=date(2024, 1, 10)) == (10, 10)
+
+
+def test_today_before_calendar():
+    assert streaks(bitmaps(date(2024, 3, 1)), today=date(2023, 12, 31)) == (0, 1)
+
+
+def test_no_activity():
+    assert streaks({}, today=date(2024, 1, 1)) == (0, 0)
+
+
+def test_longest_run():
+    assert longest_run(0) == 0
+    assert longest_run(0b1) == 1
+    assert longest_run(0b1110111101) == 4
+    assert longest_run((1 << 400) - 1) == 400
+
+
+def test_active_days_in_order_across_years():
+    days = [date(2023, 1, 1), date(2023, 12, 31), date(2024, 2, 29), date(2024, 12, 31), date(2025, 1, 1)]
+    assert active_days(bitmaps(*reversed(days))) == days
+
+
+def test_stored_streak_lapses_after_a_missed_day():
+    assert stored_streak(4, datetime(2023, 12, 31, 23, 59), today=date(2024, 1, 1)) == 4
+    assert stored_streak(4, datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc), today=date(2024, 1, 1)) == 4
+    assert stored_streak(4, datetime(2023, 12, 30, 23, 59), today=date(2024, 1, 1)) == 0
+    assert stored_streak(0, None, today=date(2024, 1, 1)) == 0
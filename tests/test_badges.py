@@ -0,0 +1,43 @@
+from badges import CRITERIA_FIELDS, DEFAULT_BADGES, BadgeEngine
+
+
+def badge(name: str, criteria_type: str, criteria_value: int) -> dict:
+    return {"id": name.lower(), "name": name, "criteria_type": criteria_type, "criteria_value": criteria_value}
+
+
+def test_definitions_sorted_by_threshold_per_type():
+    engine = BadgeEngine([
+        badge("XP 100", "xp", 100),
+        badge("Streak 7", "streak", 7),
+        badge("XP 10", "xp", 10),
+        badge("Streak 3", "streak", 3),
+    ])
+    by_type = {}
+    for definition in engine.definitions:
+        by_type.setdefault(definition["criteria_type"], []).append(definition["criteria_value"])
+    assert by_type == {"xp": [10, 100], "streak": [3, 7]}
+
+
+def test_unknown_criteria_types_are_dropped():
+    engine = BadgeEngine([badge("XP 10", "xp", 10), badge("Friends", "friends", 5)])
+    assert [definition["name"] for definition in engine.definitions] == ["XP 10"]
+    assert "Friends" not in engine.by_name
+
+
+def test_load_replaces_definitions():
+    engine = BadgeEngine([badge("XP 10", "xp", 10)])
+    engine.load([badge("Quests 1", "quests_completed", 1)])
+    assert list(engine.by_name) == ["Quests 1"]
+
+
+def test_definitions_are_copies():
+    definitions = [badge("XP 10", "xp", 10)]
+    engine = BadgeEngine(definitions)
+    engine.by_name["XP 10"]["criteria_value"] = 20
+    assert definitions[0]["criteria_value"] == 10
+
+
+def test_default_badges_are_all_loaded():
+    engine = BadgeEngine(DEFAULT_BADGES)
+    assert set(engine.by_name) == {definition["name"] for definition in DEFAULT_BADGES}
+    assert {definition["criteria_type"] for definition in engine.definitions} <= set(CRITERIA_FIELDS)
@@ -0,0 +1,69 @@
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_evicts_least_recently_used(clock):
+    entries = TTLCache(maxsize=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.get("a") == 1  # "b" is now the least recently used
+    entries.set("c", 3)
+    assert "b" not in entries
+    assert entries.get("a") == 1 and entries.get("c") == 3
+    assert entries.evictions == 1
+
+
+def test_set_existing_key_refreshes_recency(clock):
+    entries = TTLCache(maxsize=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.set("a", 10)
+    entries.set("c", 3)
+    assert entries.get("a") == 10
+    assert "b" not in entries
+
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(ttl=10)
+    entries.set("a", 1)
+    clock.now += 9.9
+    assert entries.get("a") == 1
+    clock.now += 0.1
+    assert entries.get("a", "gone") == "gone"
+    assert len(entries) == 0
+    assert entries.expirations == 1
+
+
+def test_per_entry_ttl(clock):
+    entries = TTLCache(ttl=10)
+    entries.set("short", 1, ttl=1)
+    entries.set("long", 2)
+    clock.now += 5
+    assert "short" not in entries
+    assert entries.get("long") == 2
+
+
+def test_stats(clock):
+    entries = TTLCache(maxsize=10, ttl=10)
+    entries.set("a", 1)
+    entries.get("a")
+    entries.get("b")
+    stats = entries.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 1, 0.5)
@@ -0,0 +1,142 @@
+"""
+Concurrent requests against the reward endpoints, on SQLite through the ASGI app.
+
+Every reward must land: a read-modify-write of the user would lose XP and quest
+counts here.
+"""
+
+import asyncio
+import uuid
+
+import httpx
+import pytest
+
+import server
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def client(loop):
+    lifespan = server.lifespan(server.app)
+    loop.run_until_complete(lifespan.__aenter__())
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test/api")
+    yield client
+    loop.run_until_complete(client.aclose())
+    loop.run_until_complete(lifespan.__aexit__(None, None, None))
+
+
+async def register(client: httpx.AsyncClient) -> dict:
+    name = uuid.uuid4().hex[:12]
+    response = await client.post("/auth/register", json={
+        "email": f"{name}@example.com", "username": name, "password": "password123"
+    })
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+async def current_user(client: httpx.AsyncClient, headers: dict) -> dict:
+    # Read through to storage rather than the user cache
+    server.user_cache.clear()
+    response = await client.get("/dashboard", headers=headers)
+    assert response.status_code == 200
+    return response.json()["user"]
+
+
+def test_concurrent_rewards_all_land(loop, client):
+    async def scenario():
+        headers = await register(client)
+        power_up = (await client.post("/power-ups", json={"title": "Stretch", "description": "5 minutes"},
+                                      headers=headers)).json()
+        quests = [
+            (await client.post("/quests", json={"title": f"Quest {index}", "description": "", "quest_type": "Epic"},
+                               headers=headers)).json()["id"]
+            for index in range(10)
+        ]
+
+        responses = await asyncio.gather(
+            *[client.post(f"/power-ups/{power_up['id']}/log", headers=headers) for _ in range(20)],
+            *[client.put(f"/quests/{quest_id}/complete", headers=headers) for quest_id in quests],
+        )
+        assert [response.status_code for response in responses] == [200] * 30
+
+        user = await current_user(client, headers)
+        # 20 power-ups at 5 XP and 10 Epic quests at 50 XP
+        assert user["total_xp"] == 600
+        assert user["level"] == 6
+        assert user["quests_completed"] == 10
+        assert user["current_streak"] == 1
+        assert sorted(user["badges"]) == ["First Steps", "Quest Rookie", "Rising Star"]
+
+        rank = (await client.get("/leaderboard/me", headers=headers)).json()
+        assert rank["score"] == 600
+
+    loop.run_until_complete(scenario())
+
+
+def test_concurrent_registrations_with_one_email(loop, client):
+    async def scenario():
+        body = {"email": f"{uuid.uuid4().hex[:12]}@example.com", "username": "twin", "password": "password123"}
+        responses = await asyncio.gather(*[client.post("/auth/register", json=body) for _ in range(10)])
+        assert sorted(response.status_code for response in responses) == [200] + [400] * 9
+
+    loop.run_until_complete(scenario())
+
+
+def test_concurrent_bad_guy_hits_all_land(loop, client):
+    async def scenario():
+        headers = await register(client)
+        bad_guy = (await client.post("/bad-guys", json={"title": "Procrastination", "description": "", "max_hp": 100},
+                                     headers=headers)).json()
+
+        # 25 hits of 10 damage: two kills and 50 HP left
+        responses = await asyncio.gather(*[
+            client.post(f"/bad-guys/{bad_guy['id']}/defeat", params={"damage": 10}, headers=headers)
+            for _ in range(25)
+        ])
+        assert [response.status_code for response in responses] == [200] * 25
+        assert sum("respawned" in response.json()["message"] for response in responses) == 2
+
+        bad_guys = (await client.get("/bad-guys", headers=headers)).json()
+        assert [(entry["current_hp"], entry["defeat_count"]) for entry in bad_guys] == [(50, 2)]
+        assert (await current_user(client, headers))["total_xp"] == 25 * bad_guy["defeat_xp_reward"]
+
+    loop.run_until_complete(scenario())
+
+
+def test_hits_without_damage_are_rejected(loop, client):
+    async def scenario():
+        headers = await register(client)
+        bad_guy = (await client.post("/bad-guys", json={"title": "Doomscrolling", "description": "", "max_hp": 20},
+                                     headers=headers)).json()
+
+        for damage in (0, -50):
+            response = await client.post(f"/bad-guys/{bad_guy['id']}/defeat", params={"damage": damage}, headers=headers)
+            assert response.status_code == 422
+
+        bad_guys = (await client.get("/bad-guys", headers=headers)).json()
+        assert [entry["current_hp"] for entry in bad_guys] == [20]
+        assert (await current_user(client, headers))["total_xp"] == 0
+
+    loop.run_until_complete(scenario())
+
+
+def test_concurrent_retries_with_one_idempotency_key_reward_once(loop, client):
+    async def scenario():
+        headers = await register(client)
+        power_up = (await client.post("/power-ups", json={"title": "Water", "description": ""},
+                                      headers=headers)).json()
+
+        retry = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+        responses = await asyncio.gather(*[
+            client.post(f"/power-ups/{power_up['id']}/log", headers=retry) for _ in range(5)
+        ])
+        assert len({response.content for response in responses}) == 1
+        assert (await current_user(client, headers))["total_xp"] == power_up["xp_reward"]
+
+    loop.run_until_complete(scenario())
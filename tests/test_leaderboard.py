@@ -0,0 +1,47 @@
+from leaderboard import Leaderboard
+
+
+def board(**scores) -> Leaderboard:
+    leaderboard = Leaderboard()
+    for user_id, score in scores.items():
+        leaderboard.set(user_id, score, user_id.upper())
+    return leaderboard
+
+
+def test_highest_score_first_and_ties_by_user_id():
+    leaderboard = board(carol=50, alice=80, bob=50)
+    assert [(entry["rank"], entry["user_id"], entry["score"]) for entry in leaderboard.top(10)] == [
+        (1, "alice", 80), (2, "bob", 50), (3, "carol", 50)
+    ]
+    assert leaderboard.rank("carol") == 3
+
+
+def test_update_moves_user():
+    leaderboard = board(alice=80, bob=50)
+    leaderboard.set("bob", 90)
+    assert leaderboard.rank("bob") == 1
+    assert leaderboard.rank("alice") == 2
+    assert leaderboard.score("bob") == 90
+    assert len(leaderboard) == 2
+
+
+def test_update_without_username_keeps_it():
+    leaderboard = board(alice=80)
+    leaderboard.set("alice", 100)
+    leaderboard.set("alice", 100)
+    assert leaderboard.top(1)[0]["username"] == "ALICE"
+
+
+def test_top_with_offset():
+    leaderboard = board(a=5, b=4, c=3, d=2)
+    assert [(entry["rank"], entry["user_id"]) for entry in leaderboard.top(2, offset=1)] == [(2, "b"), (3, "c")]
+    assert leaderboard.top(10, offset=4) == []
+
+
+def test_remove():
+    leaderboard = board(alice=80, bob=50)
+    leaderboard.remove("alice")
+    leaderboard.remove("nobody")
+    assert leaderboard.rank("alice") is None
+    assert leaderboard.rank("bob") == 1
+    assert leaderboard.top(10) == [{"rank": 1, "user_id": "bob", "username": "BOB", "score": 50}]
@@ -0,0 +1,59 @@
+import asyncio
+
+from push import PushHub
+
+
+def test_drain_sends_only_changed_fields():
+    hub = PushHub()
+    subscriber = hub.subscribe("user-1")
+    subscriber.push("user", {"total_xp": 10, "level": 1})
+    assert subscriber.drain() == [b'event: user\ndata: {"total_xp":10,"level":1}\n\n']
+    subscriber.push("user", {"total_xp": 20, "level": 1})
+    subscriber.push("bad_guy:b1", {"current_hp": 70})
+    assert subscriber.drain() == [
+        b'event: user\ndata: {"total_xp":20}\n\n',
+        b'event: bad_guy\ndata: {"id":"b1","current_hp":70}\n\n',
+    ]
+    subscriber.push("user", {"total_xp": 20})
+    assert subscriber.drain() == []
+
+
+def test_streams_per_user_are_limited():
+    hub = PushHub(max_per_user=2)
+    assert hub.subscribe("user-1") and hub.subscribe("user-1")
+    assert hub.subscribe("user-1") is None
+    assert hub.subscribe("user-2") is not None
+    assert hub.stats()["rejected"] == 1
+
+
+def test_ping_removes_expired_streams_that_never_started():
+    hub = PushHub(max_per_user=1)
+    subscriber = hub.subscribe("user-1")
+    # The client went away before the response body was iterated, so stream() never ran
+    subscriber.expires_at = 0
+    hub.ping()
+    assert subscriber.closed
+    assert hub.stats()["connections"] == 0
+    assert hub.subscribe("user-1") is not None
+
+
+def test_expired_stream_ends():
+    async def run():
+        hub = PushHub()
+        subscriber = hub.subscribe("user-1")
+        chunks = []
+
+        async def drain():
+            async for chunk in hub.stream(subscriber):
+                chunks.append(chunk)
+
+        task = asyncio.create_task(drain())
+        await asyncio.sleep(0)
+        subscriber.expires_at = 0
+        hub.ping()
+        await asyncio.wait_for(task, 1)
+        return hub, chunks
+
+    hub, chunks = asyncio.run(run())
+    assert chunks == [b"retry: 3000\n\n"]
+    assert hub.stats()["connections"] == 0
@@ -0,0 +1,67 @@
+"""
+build_reward_pipeline (Mongo) and reward_user (SQLite) must change a user the same way.
+
+The pipeline is run through tests/pipeline.py, so the comparison needs no MongoDB.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from badges import DEFAULT_BADGES, BadgeEngine
+from repositories import build_reward_pipeline
+from sqlite_repositories import reward_user
+
+from .pipeline import run_pipeline
+
+NOW = datetime(2024, 12, 31, 18, 30, tzinfo=timezone.utc)
+TODAY = datetime(2024, 12, 31)
+BADGES = BadgeEngine(DEFAULT_BADGES).definitions
+
+
+def apply_reward_user(doc: dict, *args) -> dict:
+    return {**doc, **reward_user(doc, *args, BADGES, NOW)}
+
+
+USERS = {
+    "new user": {},
+    "nulls": {"total_xp": None, "quests_completed": None, "current_streak": None, "longest_streak": None,
+              "last_activity_date": None, "badges": None},
+    "active today": {"total_xp": 95, "current_streak": 2, "longest_streak": 5,
+                     "last_activity_date": TODAY + timedelta(hours=1), "badges": ["First Steps"]},
+    "active yesterday": {"total_xp": 990, "quests_completed": 9, "current_streak": 2, "longest_streak": 2,
+                         "last_activity_date": TODAY - timedelta(hours=1), "badges": ["First Steps", "Rising Star"]},
+    "streak broken": {"total_xp": 40, "current_streak": 29, "longest_streak": 29,
+                      "last_activity_date": TODAY - timedelta(days=1, hours=1), "badges": ["First Steps"]},
+    "long streak": {"total_xp": 40, "current_streak": 29, "longest_streak": 29,
+                    "last_activity_date": TODAY - timedelta(minutes=1), "badges": []},
+    "badges out of order": {"total_xp": 5000, "quests_completed": 100, "longest_streak": 40,
+                            "badges": ["Quest Champion", "Experience Master"]},
+}
+
+REWARDS = {
+    "quest": (50, True, 1),
+    "power-up": (5, False, 0),
+    "no xp": (0, True, 0),
+}
+
+
+@pytest.mark.parametrize("reward", REWARDS.values(), ids=REWARDS.keys())
+@pytest.mark.parametrize("user", USERS.values(), ids=USERS.keys())
+def test_pipeline_matches_reward_user(user, reward):
+    pipeline = build_reward_pipeline(*reward, BADGES, now=NOW)
+    assert run_pipeline(pipeline, user) == apply_reward_user(user, *reward)
+
+
+def test_badges_crossed_by_one_reward_are_all_awarded():
+    user = {"total_xp": 5, "quests_completed": 9, "current_streak": 2, "longest_streak": 2,
+            "last_activity_date": TODAY - timedelta(hours=1), "badges": []}
+    updated = run_pipeline(build_reward_pipeline(100, True, 1, BADGES, now=NOW), user)
+    assert updated["badges"] == ["First Steps", "Rising Star", "Streak Starter", "Quest Rookie"]
+    assert (updated["total_xp"], updated["level"], updated["current_streak"]) == (105, 1, 3)
+
+
+def test_held_badges_are_not_awarded_again():
+    user = {"total_xp": 150, "badges": ["Rising Star", "First Steps"]}
+    updated = run_pipeline(build_reward_pipeline(10, False, 0, BADGES, now=NOW), user)
+    assert updated["badges"] == ["Rising Star", "First Steps"]
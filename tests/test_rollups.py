@@ -0,0 +1,48 @@
+from datetime import date
+
+from rollups import COUNTERS, _backfill_pipelines, _backfill_update, fill_days
+
+from .pipeline import run_pipeline
+
+
+def backfill(doc: dict, counters: dict, xp_field: str) -> dict:
+    return run_pipeline(_backfill_update(counters, xp_field), doc)
+
+
+def test_backfill_of_a_day_without_rollup():
+    doc = backfill({}, {"quests_completed": 2, "quest_xp": 60}, "quest_xp")
+    doc = backfill(doc, {"power_ups_logged": 3, "power_up_xp": 15}, "power_up_xp")
+    doc = backfill(doc, {"bad_guy_hits": 4, "bad_guy_xp": 60}, "bad_guy_xp")
+    assert doc == {"xp": 135, "quests_completed": 2, "quest_xp": 60, "power_ups_logged": 3, "power_up_xp": 15,
+                   "bad_guy_hits": 4, "bad_guy_xp": 60}
+
+
+def test_backfill_is_idempotent():
+    counters = {"power_ups_logged": 3, "power_up_xp": 15}
+    once = backfill({}, counters, "power_up_xp")
+    assert backfill(once, counters, "power_up_xp") == once
+
+
+def test_backfill_keeps_live_counters_of_other_sources():
+    # A day live rollups counted: a side quest (8 XP) and two quests (60 XP)
+    live = {"xp": 68, "quest_xp": 60, "quests_completed": 2, "side_quests_completed": 1}
+    doc = backfill(live, {"quests_completed": 2, "quest_xp": 60}, "quest_xp")
+    assert doc == live
+    doc = backfill(doc, {"power_ups_logged": 1, "power_up_xp": 5}, "power_up_xp")
+    assert doc["xp"] == 73
+    assert doc["side_quests_completed"] == 1
+
+
+def test_every_backfilled_field_is_a_counter():
+    for xp_field, pipeline in _backfill_pipelines(date(2024, 6, 1)).values():
+        fields = set(pipeline[-1]["$group"]) - {"_id"}
+        assert xp_field in fields
+        assert fields <= set(COUNTERS)
+
+
+def test_fill_days_zeroes_days_without_rollup():
+    days = fill_days({"2024-02-29": {"xp": 10, "quest_xp": 10, "quests_completed": 1}},
+                     date(2024, 2, 28), date(2024, 3, 1))
+    assert [day["day"] for day in days] == ["2024-02-28", "2024-02-29", "2024-03-01"]
+    assert [day["xp"] for day in days] == [0, 10, 0]
+    assert set(days[0]) == {"day", *COUNTERS}
@@ -0,0 +1,52 @@
+import asyncio
+
+from repositories import StorageError
+from writebehind import WriteBehindBuffer
+
+
+class Logs:
+    """A log repository that fails the first ``failures`` batches and rejects documents marked bad."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.rows = []
+
+    async def insert_many(self, kind: str, docs: list) -> dict:
+        if self.failures:
+            self.failures -= 1
+            raise StorageError("database unreachable")
+        self.rows += [doc for doc in docs if not doc.get("bad")]
+        return {position: "rejected" for position, doc in enumerate(docs) if doc.get("bad")}
+
+
+def flush(logs: Logs, documents: list, max_retries: int = 3) -> WriteBehindBuffer:
+    async def run():
+        buffer = WriteBehindBuffer(logs, flush_interval=0.01, max_retries=max_retries)
+        buffer.start()
+        for document in documents:
+            await buffer.put("power_up_logs", document)
+        await buffer.stop()
+        return buffer
+
+    return asyncio.run(run())
+
+
+def test_storage_errors_are_retried():
+    logs = Logs(failures=1)
+    buffer = flush(logs, [{"n": 1}, {"n": 2}])
+    assert logs.rows == [{"n": 1}, {"n": 2}]
+    assert (buffer.flushed, buffer.dropped) == (2, 0)
+
+
+def test_batch_dropped_after_last_retry():
+    logs = Logs(failures=1)
+    buffer = flush(logs, [{"n": 1}, {"n": 2}], max_retries=1)
+    assert logs.rows == []
+    assert (buffer.flushed, buffer.dropped) == (0, 2)
+
+
+def test_rejected_documents_are_dropped_without_retry():
+    logs = Logs()
+    buffer = flush(logs, [{"n": 1}, {"n": 2, "bad": True}, {"n": 3}])
+    assert logs.rows == [{"n": 1}, {"n": 3}]
+    assert (buffer.flushed, buffer.dropped) == (2, 1)